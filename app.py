@@ -5,104 +5,138 @@ import GitIgnorables.Authcode as Authcode
 import commands.textcommands
 import asyncio
 import os
+import time
 import json
+import hashlib
 from discord import app_commands
 from discord.ext import commands
+from utils.provisioning import ProvisioningStore, GuildProvisioner
+from utils.metrics import process_rss
 
 intents = dc.Intents.default()
 intents.message_content = True
 intents.guilds = True
 intents.voice_states = True
 intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+
+#Lean mode keeps only members who sit in a voice channel (the player's idle check needs those) and skips
+#chunking every guild on connect. No command reads the full member list: interactions, messages and voice
+#states all carry their own member data.
+LEAN_CACHE = os.getenv("DA_LEAN_CACHE", "0") == "1"
+cache_options = {}
+if LEAN_CACHE:
+    member_cache_flags = dc.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+    cache_options = {"member_cache_flags": member_cache_flags, "chunk_guilds_at_startup": False}
+
+#Shards are handed out by launcher.py through the environment, a plain `python app.py` runs unsharded.
+SHARD_COUNT = os.getenv("DA_SHARD_COUNT")
+SHARD_IDS = os.getenv("DA_SHARD_IDS")
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        **cache_options,
+        shard_count=int(SHARD_COUNT),
+        shard_ids=[int(shard_id) for shard_id in SHARD_IDS.split(",")] if SHARD_IDS else None
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, **cache_options)
+
+provisioning_store = ProvisioningStore()
+provisioner = GuildProvisioner(provisioning_store)
+
+#Fingerprint of the registered slash commands as of the last successful sync.
+COMMAND_FINGERPRINT_FILE = os.getenv("DA_COMMAND_FINGERPRINT", ".command_tree.sha256")
+commands_synced = False
+
+def command_tree_fingerprint():
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    payload.sort(key=lambda command: command["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def read_fingerprint():
+    try:
+        with open(COMMAND_FINGERPRINT_FILE, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def write_fingerprint(fingerprint):
+    with open(COMMAND_FINGERPRINT_FILE, "w") as f:
+        f.write(fingerprint)
+
+async def sync_commands():
+    global commands_synced
+    #Once per process is enough, on_ready also fires after every reconnect.
+    if commands_synced:
+        return
+
+    #With several worker processes only the one running shard 0 talks to the global command API.
+    shard_ids = getattr(bot, "shard_ids", None)
+    if shard_ids is not None and 0 not in shard_ids:
+        commands_synced = True
+        return
+
+    fingerprint = command_tree_fingerprint()
+    if os.getenv("DA_FORCE_SYNC") != "1" and fingerprint == read_fingerprint():
+        print(f'Slash commands unchanged since the last sync, skipping it')
+        commands_synced = True
+        return
+
+    started = time.perf_counter()
+    syncLen = await bot.tree.sync()
+    write_fingerprint(fingerprint)
+    commands_synced = True
+    print(f'Synced {len(syncLen)} slash-based commands in {(time.perf_counter() - started) * 1000:.0f}ms')
 
 @bot.event
 async def on_connect():
     print(f"Succesfully connected to Discord's servers.")
     return
 
+def report_memory():
+    rss = process_rss()
+    if rss is None:
+        return
+    guilds = len(bot.guilds)
+    members = sum(len(guild.members) for guild in bot.guilds)
+    print(f"Memory: {rss / 1024 ** 2:.1f}MB RSS for {guilds} guilds ({rss / max(1, guilds) / 1024:.1f}KB per guild), "
+          f"{members} cached members, lean cache {'on' if LEAN_CACHE else 'off'}")
+
 @bot.event
 async def on_ready():
     print(f"Successfuly logged on as {bot.user}")
+    report_memory()
 
     #Trying to sync slash commands globally
     try:
-        syncLen = await bot.tree.sync()
-        print(f'Synced {len(syncLen)} slash-based commands')
+        await sync_commands()
     except Exception as e:
         print(f'Failed to sync commands due to: {e}')
 
+    #Finish setting up guilds whose provisioning was cut short or hit a transient error last time.
+    for guild_id in provisioning_store.partial():
+        guild = bot.get_guild(guild_id)
+        if guild:
+            asyncio.create_task(provisioner.provision(guild))
+
 @bot.event
 async def on_guild_join(guild: dc.Guild):
     print(f"Bot joined a new guild: {guild.name} ({guild.id})")
-    overwrites = {
-        guild.default_role: dc.PermissionOverwrite(read_messages=False),
-        guild.me: dc.PermissionOverwrite(read_messages=True),
-    }
-    
-    try:
-        print("Attempting to create debug role...")
-        debug_role = await guild.create_role(
-            name="DA Debug",
-            color=dc.Color.dark_gray(),
-            permissions=dc.Permissions(permissions=5),
-            reason="Auto-created by bot for debugging purposes"
-        )
-        print(f"Debug role created: {debug_role.name}")
-    except Exception as e:
-        debug_role = None
-        print(f'Failed to create debug role due to: {e}')
-
-    if debug_role:
-        overwrites[debug_role] = dc.PermissionOverwrite(read_messages=True)
-
-    try:
-        dj_role = await guild.create_role(
-            name="Devil's DJ",
-            color=dc.Color.red(),
-            permissions=dc.Permissions(permissions=5),
-            reason="Auto-created to allow music operation."
-        )
-        print(f"DJ role created: {dj_role.name}")
-    except Exception as e:
-        print(f'Failed to create DJ role due to: {e}')
-
-    try:
-        print("Attempting to create debug channel...")
-        debug_channel = await guild.create_text_channel(
-            name='devils-advocate-debug-channel',
-            overwrites=overwrites,
-            reason="Auto-created by bot for debugging purposes"
-        )
-        print(f"Debug channel created: {debug_channel.name}")
-    except Exception as e:
-        print(f"Couldn't create debug channel due to: {e}")
 
     try:
-        print("Attempting to create log channel...")
-        log_channel = await guild.create_text_channel(
-            name='da-logs',
-            overwrites=overwrites,
-            reason="Auto-created by bot for logging purposes"
-        )
-        print(f"Log channel created: {log_channel.name}")
+        await provisioner.provision(guild)
     except Exception as e:
-        print(f"Couldn't create log channel due to: {e}")
+        print(f"Couldn't provision {guild.name} due to: {e}")
 
     try:
-        QUOTE_DIR = "server_quotes"
-        def get_server_file(guild_id):
-            return os.path.join(QUOTE_DIR, f"{guild_id}.json")
-        
-        file_path = get_server_file(guild.id)
-        if not os.path.exists(file_path):
-            with open(file_path, "w") as f:
-                json.dump([], f, indent=4)
-            print(f"Created a new quotes file for guild: {guild.name} ({guild.id})")
-        else:
-            print(f"Quotes file for guild {guild.name} ({guild.id}) already exists.")
+        quotes_cog = bot.get_cog("quotecommands")
+        if quotes_cog:
+            quotes_cog.store.ensure_guild(guild.id)
+            print(f"Quote storage ready for guild: {guild.name} ({guild.id})")
     except Exception as e:
-        print(f'Couldnt create the server quote file due to: {e}')
+        print(f'Couldnt prepare the server quote storage due to: {e}')
 
 #Run Function
 async def run():
@@ -110,4 +144,5 @@ async def run():
         await bot.load_extension("commands")
         await bot.start(Authcode.token)
 
-asyncio.run(run())
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,269 @@
+import asyncio
+import itertools
+import time
+from datetime import datetime, timezone
+
+#Stand-ins for the handful of discord.py objects the cogs touch, just enough surface to drive a
+#command end to end without a gateway connection. Nothing is sent anywhere, replies are only recorded.
+ids = itertools.count(1 << 40)
+
+def snowflake():
+    return next(ids)
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+class FakeUser:
+    def __init__(self, name, voice_channel=None, bot=False):
+        self.id = snowflake()
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+        self.voice = None
+        if voice_channel is not None:
+            self.voice = FakeVoiceState(voice_channel)
+            voice_channel.members.append(self)
+            voice_channel.guild.members[self.id] = self
+
+    def __str__(self):
+        return self.name
+
+class FakeGuild:
+    def __init__(self, name):
+        self.id = snowflake()
+        self.name = name
+        self.members = {}
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+class FakeReference:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+class FakeMessage:
+    def __init__(self, content, author, channel, reference=None):
+        self.id = snowflake()
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.reference = reference
+        self.created_at = datetime.now(timezone.utc)
+
+    def is_system(self):
+        return False
+
+    async def edit(self, **kwargs):
+        pass
+
+class FakeTextChannel:
+    def __init__(self, guild, name="general"):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.messages = {}
+        self.sent = []  # (time.time(), content) of everything the bot sent here
+
+    def post(self, content, author, reference=None):
+        message = FakeMessage(content, author, self, reference)
+        self.messages[message.id] = message
+        return message
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((time.time(), content))
+        return FakeMessage(content, None, self)
+
+    async def fetch_message(self, message_id):
+        return self.messages[message_id]
+
+#Plays nothing, it only keeps the same state machine as discord.VoiceClient so the player's
+#after callbacks, idle checks and queue transitions behave like they would live.
+class FakeAudioSource:
+    def __init__(self, source, codec):
+        self.source = source
+        self.codec = codec
+
+    def read(self):
+        return b""
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        pass
+
+def open_fake_source(source, codec, before_options, label):
+    return FakeAudioSource(source, codec)
+
+class FakeVoiceClient:
+    def __init__(self, channel):
+        self.channel = channel
+        self.connected = True
+        self.source = None
+        self.after = None
+        self.paused = False
+
+    def is_connected(self):
+        return self.connected
+
+    def is_playing(self):
+        return self.source is not None and not self.paused
+
+    def is_paused(self):
+        return self.source is not None and self.paused
+
+    def play(self, source, after=None):
+        if self.source is not None:
+            raise RuntimeError("Already playing audio.")
+        self.source = source
+        self.after = after
+        self.paused = False
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        source, after = self.source, self.after
+        self.source = self.after = None
+        self.paused = False
+        if source is not None:
+            source.cleanup()
+            if after:
+                after(None)
+
+    async def disconnect(self, force=False):
+        self.connected = False
+        self.stop()
+
+class FakeVoiceChannel:
+    def __init__(self, guild, name="Music"):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.members = []
+
+    @property
+    def voice_states(self):
+        return {member.id: member.voice for member in self.members}
+
+    async def connect(self, **kwargs):
+        return FakeVoiceClient(self)
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+        self.content = None
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self.content = content
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def edit_message(self, **kwargs):
+        self.done = True
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+class FakeInteraction:
+    def __init__(self, guild, channel, user):
+        self.guild = guild
+        self.channel = channel
+        self.channel_id = channel.id
+        self.user = user
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+    async def original_response(self):
+        return FakeMessage(self.response.content, None, self.channel)
+
+class FakeBot:
+    def __init__(self):
+        self.user = FakeUser("Devil's Advocate", bot=True)
+        self.loop = asyncio.get_running_loop()
+        self.shard_count = None
+        self.channels = {}
+        self.pending = []  # Messages handed to the next matching wait_for()
+        self.cogs = {}
+
+    def add_channel(self, channel):
+        self.channels[channel.id] = channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id):
+        return self.channels[channel_id]
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+    def is_ready(self):
+        return True
+
+    async def wait_for(self, event, check=None, timeout=None):
+        for i, message in enumerate(self.pending):
+            if check is None or check(message):
+                return self.pending.pop(i)
+        raise asyncio.TimeoutError()
+
+#Answers like ExtractionPool would, from made-up but well-formed yt-dlp info dicts.
+#`delay` stands in for the time a real extraction spends off the event loop.
+class FakeExtractor:
+    def __init__(self, playlist_size=50, delay=0):
+        self.playlist_size = playlist_size
+        self.delay = delay
+        self.calls = 0
+
+    def video(self, n):
+        video_id = f"{n % 10 ** 11:011d}"
+        return {
+            "id": video_id,
+            "title": f"Benchmark track {n}",
+            "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+            "duration": 180 + n % 120,
+            "formats": [{
+                "url": f"https://bench.invalid/videoplayback?id={video_id}&expire={int(time.time()) + 21600}",
+                "acodec": "opus",
+                "vcodec": "none",
+                "abr": 160,
+            }],
+        }
+
+    def entry(self, n):
+        video_id = f"{n % 10 ** 11:011d}"
+        return {
+            "title": f"Benchmark track {n}",
+            "url": f"https://www.youtube.com/watch?v={video_id}",
+            "duration": 180 + n % 120,
+        }
+
+    async def extract(self, query, opts):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        seed = abs(hash(query))
+        if "list=" in query:
+            return {"title": "Benchmark playlist", "entries": [self.entry(seed + i) for i in range(self.playlist_size)]}
+        if query.startswith("ytsearch:"):
+            return {"entries": [self.entry(seed)]}
+        if "v=" in query:
+            return self.video(int(query.rsplit("v=", 1)[1][:11]))
+        return self.video(seed)
+
+    def shutdown(self):
+        pass
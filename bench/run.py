@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#Offline benchmark for the command hot paths: the real cogs driven by the fakes in bench/fakes.py.
+#`python bench/run.py` from the repo root, --help for the knobs. --save writes the results as JSON,
+#--compare fails (exit 1) when a scenario got slower than a saved run by more than --tolerance.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fakes import (
+    FakeBot, FakeExtractor, FakeGuild, FakeInteraction, FakeReference, FakeTextChannel, FakeUser,
+    FakeVoiceChannel, open_fake_source
+)
+
+def rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    if resource is not None:
+        #Peak rather than current, but still shows growth. Linux reports KiB.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class Scenario:
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+        self.errors = 0
+        self.wall = 0.0
+        self.memory = 0
+
+    #Runs make() for every item, at most `concurrency` at a time, timing each call.
+    async def run(self, items, make, concurrency=1):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(item):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await make(item)
+                except Exception as e:
+                    self.errors += 1
+                    if self.errors == 1:
+                        print(f"{self.name}: first error: {e!r}")
+                self.samples.append(time.perf_counter() - started)
+
+        gc.collect()
+        before = rss()
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(item) for item in items))
+        self.wall += time.perf_counter() - started
+        gc.collect()
+        self.memory += rss() - before
+        return self
+
+    def result(self):
+        return {
+            "ops": len(self.samples),
+            "ops_per_s": len(self.samples) / self.wall if self.wall else 0.0,
+            "p50_ms": percentile(self.samples, 0.50) * 1000,
+            "p99_ms": percentile(self.samples, 0.99) * 1000,
+            "max_ms": max(self.samples, default=0.0) * 1000,
+            "errors": self.errors,
+            "memory_mb": self.memory / 1024 ** 2,
+        }
+
+class World:
+    def __init__(self, bot, guilds):
+        self.bot = bot
+        self.guilds = []
+        for i in range(guilds):
+            guild = FakeGuild(f"Guild {i}")
+            text = FakeTextChannel(guild)
+            voice = FakeVoiceChannel(guild)
+            user = FakeUser(f"user{i}", voice_channel=voice)
+            bot.add_channel(text)
+            self.guilds.append((guild, text, voice, user))
+
+    def interaction(self, i, user=None):
+        guild, text, voice, owner = self.guilds[i]
+        return FakeInteraction(guild, text, user or owner)
+
+async def bench_voice(bot, world, args):
+    import utils.player
+    from commands.voicecommands import voicecommands
+    utils.player.open_audio_source = open_fake_source
+
+    cog = voicecommands(bot)
+    cog.extractor.shutdown()
+    cog.extractor = FakeExtractor(playlist_size=args.tracks, delay=args.extract_delay)
+    await cog.cog_load()
+    guilds = range(len(world.guilds))
+    scenarios = []
+    try:
+        playlist = lambda i: cog.play.callback(cog, world.interaction(i), f"https://www.youtube.com/playlist?list=PLbench{i}")
+        scenarios.append(await Scenario("voice.play_playlist").run(guilds, playlist, args.concurrency))
+
+        single = lambda i: cog.play.callback(cog, world.interaction(i % len(world.guilds)), f"https://www.youtube.com/watch?v={i:011d}")
+        scenarios.append(await Scenario("voice.play_single").run(range(len(world.guilds) * 4), single, args.concurrency))
+
+        queue_pages = lambda i: cog.queue_cmd.callback(cog, world.interaction(i % len(world.guilds)))
+        scenarios.append(await Scenario("voice.queue").run(range(len(world.guilds) * 4), queue_pages, args.concurrency))
+
+        def remove(i):
+            guild = i % len(world.guilds)
+            index = random.randint(1, max(1, len(cog.players[world.guilds[guild][0].id].queue)))
+            return cog.remove.callback(cog, world.interaction(guild), index)
+        scenarios.append(await Scenario("voice.remove").run(range(len(world.guilds) * 4), remove, args.concurrency))
+
+        queued = sum(len(player.queue) for player in cog.players.values())
+        print(f"voice: {len(cog.players)} players, {queued} queued tracks, {cog.extractor.calls} extractions")
+    finally:
+        await cog.cog_unload()
+    return scenarios
+
+async def bench_quotes(bot, world, args):
+    from commands.quotecommands import quotecommands
+
+    cog = quotecommands(bot)
+    await cog.cog_load()
+    scenarios = []
+    try:
+        def save(i):
+            guild, text, voice, user = world.guilds[i % len(world.guilds)]
+            target = text.post(f"Quote number {i} about the benchmark and nothing else", user)
+            bot.pending.append(text.post("", user, FakeReference(target.id)))
+            return cog.save_quote.callback(cog, world.interaction(i % len(world.guilds)))
+        scenarios.append(await Scenario("quotes.save_quote").run(range(len(world.guilds) * args.quotes), save, args.concurrency))
+
+        list_pages = lambda i: cog.listQuotes.callback(cog, world.interaction(i % len(world.guilds)))
+        scenarios.append(await Scenario("quotes.list_quotes").run(range(len(world.guilds) * 4), list_pages, args.concurrency))
+
+        def remove(i):
+            guild = world.guilds[i % len(world.guilds)][0]
+            return cog.removeQuote.callback(cog, world.interaction(i % len(world.guilds)), random.randint(1, max(1, cog.store.count(guild.id))))
+        scenarios.append(await Scenario("quotes.remove_quote").run(range(len(world.guilds) * 4), remove, args.concurrency))
+    finally:
+        await cog.cog_unload()
+    return scenarios
+
+async def bench_timers(bot, world, args):
+    from commands.timercommands import timercommands
+
+    cog = timercommands(bot)
+    await cog.cog_load()
+    scenarios = []
+    try:
+        #The cog caps users at 3 timers, so every timer gets its own user.
+        users = [FakeUser(f"timer{i}") for i in range(args.timers)]
+        start = lambda i: cog.timerStart.callback(cog, world.interaction(i % len(world.guilds), users[i]), 0, 0, args.timer_seconds)
+        scenarios.append(await Scenario("timers.start_timer").run(range(args.timers), start, args.concurrency))
+
+        list_timers = lambda i: cog.listTimers.callback(cog, world.interaction(i % len(world.guilds), users[i]))
+        scenarios.append(await Scenario("timers.list_timers").run(range(args.timers), list_timers, args.concurrency))
+
+        #Timers keep firing while the cancels run, whatever is left at the end fires normally.
+        due = {user_id: timers[0].call.due for user_id, timers in cog.timers.items()}
+        cancelled = users[:args.timers // 10]
+        cancel = lambda user: cog.cancelTimers.callback(cog, world.interaction(0, user))
+        scenarios.append(await Scenario("timers.cancel_timers").run(cancelled, cancel, args.concurrency))
+        for user in cancelled:
+            due.pop(user.id, None)
+
+        deadline = time.time() + args.timer_seconds + 30
+        while cog.timers and time.time() < deadline:
+            await asyncio.sleep(0.1)
+
+        #How late each reminder went out compared to when it was due.
+        fired = Scenario("timers.fire_lateness")
+        for guild, text, voice, user in world.guilds:
+            for sent_at, content in text.sent:
+                user_id = int(content.split("<@", 1)[1].split(">", 1)[0])
+                if user_id in due:
+                    fired.samples.append(max(0.0, sent_at - due.pop(user_id)))
+        fired.errors = len(due)
+        fired.wall = args.timer_seconds
+        scenarios.append(fired)
+    finally:
+        await cog.cog_unload()
+    return scenarios
+
+SUITES = {
+    "voice": bench_voice,
+    "quotes": bench_quotes,
+    "timers": bench_timers,
+}
+
+def report(results):
+    print(f"{'scenario':<24}{'ops':>8}{'ops/s':>11}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}{'mem MB':>9}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['ops']:>8}{r['ops_per_s']:>11.0f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['max_ms']:>10.3f}{r['errors']:>8}{r['memory_mb']:>9.1f}")
+
+#Only the latency and throughput are compared, memory and timer lateness depend too much on the host.
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, r in results.items():
+        old = baseline.get(name)
+        if old is None or name == "timers.fire_lateness":
+            continue
+        if r["p99_ms"] > old["p99_ms"] * (1 + tolerance) and r["p99_ms"] - old["p99_ms"] > 0.05:
+            regressions.append(f"{name}: p99 {old['p99_ms']:.3f}ms -> {r['p99_ms']:.3f}ms")
+        if r["ops_per_s"] < old["ops_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: {old['ops_per_s']:.0f} -> {r['ops_per_s']:.0f} ops/s")
+        if r["errors"] > old["errors"]:
+            regressions.append(f"{name}: {old['errors']} -> {r['errors']} errors")
+    return regressions
+
+async def main(args):
+    #Every store the cogs open is relative to the working directory, so it all lands in a throwaway one.
+    workdir = tempfile.TemporaryDirectory(prefix="da-bench-")
+    os.chdir(workdir.name)
+    #The cogs log every queue change at INFO, which would end up dominating the numbers.
+    logging.disable(logging.INFO)
+    random.seed(args.seed)
+
+    bot = FakeBot()
+    world = World(bot, args.guilds)
+    results = {}
+    started = rss()
+    try:
+        for suite in args.suites:
+            for scenario in await SUITES[suite](bot, world, args):
+                results[scenario.name] = scenario.result()
+    finally:
+        os.chdir(ROOT)
+        workdir.cleanup()
+
+    print(f"\n{args.guilds} guilds, {args.tracks} tracks/playlist, {args.quotes} quotes/guild, {args.timers} timers, concurrency {args.concurrency}")
+    report(results)
+    print(f"RSS grew by {(rss() - started) / 1024 ** 2:.1f}MB over the run ({'psutil' if psutil else 'peak RSS'})")
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's commands against fake Discord and yt-dlp objects.")
+    parser.add_argument("--suites", nargs="+", choices=sorted(SUITES), default=list(SUITES))
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--tracks", type=int, default=200, help="tracks per playlist, one playlist per guild")
+    parser.add_argument("--quotes", type=int, default=20, help="quotes saved per guild")
+    parser.add_argument("--timers", type=int, default=5000)
+    parser.add_argument("--timer-seconds", type=int, default=2)
+    parser.add_argument("--extract-delay", type=float, default=0, help="simulated seconds per extraction")
+    parser.add_argument("--concurrency", type=int, default=1, help="commands in flight at once")
+    parser.add_argument("--quote-backend", choices=["sqlite", "json"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier --save to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.quote_backend:
+        #Read when utils.quotestore is imported, which only happens once the quotes suite starts.
+        os.environ["DA_QUOTE_BACKEND"] = args.quote_backend
+    for path in ("save", "compare"):
+        if getattr(args, path):
+            setattr(args, path, os.path.abspath(getattr(args, path)))
+
+    results = asyncio.run(main(args))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
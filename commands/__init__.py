@@ -1,6 +1,16 @@
 import os
+import time
 
 async def setup(bot):
-    for filename in os.listdir(os.path.dirname(__file__)):
+    started = time.perf_counter()
+    for filename in sorted(os.listdir(os.path.dirname(__file__))):
         if filename.endswith(".py") and filename != "__init__.py":
-            await bot.load_extension(f"commands.{filename[:-3]}")
\ No newline at end of file
+            loaded = time.perf_counter()
+            await bot.load_extension(f"commands.{filename[:-3]}")
+            print(f"Loaded commands.{filename[:-3]} in {(time.perf_counter() - loaded) * 1000:.1f}ms")
+    print(f"Loaded all command extensions in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    #Wrapped only now so the slash commands of every cog get timed, not just the ones loaded before statcommands.
+    stats = bot.get_cog("statcommands")
+    if stats:
+        stats.metrics.instrument(bot.tree)
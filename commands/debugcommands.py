@@ -0,0 +1,129 @@
+import asyncio
+import io
+import os
+import threading
+import time
+import discord as dc
+from discord import app_commands
+from discord.ext import commands
+from utils.loopdebug import BlockingDetector, SamplingProfiler, BLOCKING_THRESHOLD, BLOCKING_REPORT_INTERVAL
+from utils.provisioning import DEBUG_CHANNEL
+
+PROFILE_MAX_SECONDS = 120
+#Guild whose debug channel gets the stall reports when the detector is turned on from the environment.
+DEBUG_GUILD = os.getenv("DA_DEBUG_GUILD")
+
+class debugcommands(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.detector = None
+        self.report_guild_id = int(DEBUG_GUILD) if DEBUG_GUILD else None
+        self.last_report = 0
+        self.skipped_reports = 0
+        self.profiling = False
+
+    async def cog_load(self):
+        if BLOCKING_THRESHOLD:
+            self.startDetector(float(BLOCKING_THRESHOLD) / 1000)
+
+    async def cog_unload(self):
+        if self.detector:
+            self.detector.stop()
+
+    def startDetector(self, threshold):
+        if self.detector:
+            self.detector.stop()
+        self.detector = BlockingDetector(threshold, self.onBlock)
+        self.detector.start()
+
+    def debugChannel(self, guild_id):
+        guild = self.bot.get_guild(guild_id) if guild_id else None
+        if guild is None:
+            return None
+        return dc.utils.get(guild.text_channels, name=DEBUG_CHANNEL)
+
+    async def checkOwner(self, interaction: dc.Interaction):
+        if await self.bot.is_owner(interaction.user):
+            return True
+        await interaction.response.send_message("Only the bot owner can use this.", ephemeral=True)
+        return False
+
+    #Every stall is already logged with its stack, Discord only gets one report per interval.
+    def onBlock(self, duration, stack):
+        now = time.monotonic()
+        if now - self.last_report < BLOCKING_REPORT_INTERVAL:
+            self.skipped_reports += 1
+            return
+        self.last_report = now
+        skipped, self.skipped_reports = self.skipped_reports, 0
+        asyncio.create_task(self.reportBlock(duration, stack, skipped))
+
+    async def reportBlock(self, duration, stack, skipped):
+        channel = self.debugChannel(self.report_guild_id)
+        if channel is None:
+            return
+        text = f"Event loop was blocked for {duration * 1000:.0f}ms"
+        if skipped:
+            text += f", {skipped} more stall(s) since the last report"
+        try:
+            #Keep the innermost frames, that's where the blocking call is.
+            await channel.send(f"{text}:\n```py\n{stack[-1800:]}\n```")
+        except dc.HTTPException as e:
+            print(f"Couldn't post the blocking report due to: {e}")
+
+    @dc.app_commands.command(name="debug_blocking", description="Reports anything holding the event loop longer than the threshold")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.guild_only()
+    async def debugBlocking(self, interaction: dc.Interaction, enabled: bool, threshold_ms: int = 100):
+        if not await self.checkOwner(interaction):
+            return
+
+        if not enabled:
+            if self.detector:
+                self.detector.stop()
+                self.detector = None
+            await interaction.response.send_message("Blocking-call detector is off.", ephemeral=True)
+            return
+
+        if threshold_ms < 10:
+            await interaction.response.send_message("The threshold has to be at least 10ms.", ephemeral=True)
+            return
+        self.report_guild_id = interaction.guild.id
+        self.startDetector(threshold_ms / 1000)
+        where = f"#{DEBUG_CHANNEL}" if self.debugChannel(interaction.guild.id) else "the console (this server has no debug channel)"
+        await interaction.response.send_message(f"Reporting event loop stalls over {threshold_ms}ms to {where}.", ephemeral=True)
+
+    @dc.app_commands.command(name="profile", description="Samples what the bot is doing for a while and posts the profile")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.guild_only()
+    async def profile(self, interaction: dc.Interaction, seconds: int = 10, all_threads: bool = False):
+        if not await self.checkOwner(interaction):
+            return
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            await interaction.response.send_message(f"Pick between 1 and {PROFILE_MAX_SECONDS} seconds.", ephemeral=True)
+            return
+        if self.profiling:
+            await interaction.response.send_message("A profile is already being captured.", ephemeral=True)
+            return
+
+        await interaction.response.send_message(f"Profiling for {seconds}s...", ephemeral=True)
+        self.profiling = True
+        try:
+            #The sampler runs on its own thread, by default only the event loop's thread is sampled.
+            profiler = SamplingProfiler(None if all_threads else threading.get_ident())
+            await asyncio.get_running_loop().run_in_executor(None, profiler.run, seconds)
+        finally:
+            self.profiling = False
+
+        summary = profiler.summary()
+        files = [dc.File(io.BytesIO(profiler.collapsed().encode()), filename="profile.collapsed.txt")]
+        channel = self.debugChannel(interaction.guild.id) or interaction.channel
+        try:
+            await channel.send(f"Profile requested by {interaction.user.mention}:\n```\n{summary[:1850]}\n```", files=files)
+            await interaction.edit_original_response(content=f"Profile posted in {channel.mention}.")
+        except dc.HTTPException as e:
+            print(f"Couldn't post the profile due to: {e}")
+            await interaction.edit_original_response(content=f"Couldn't post the profile: {e}")
+
+async def setup(bot):
+    await bot.add_cog(debugcommands(bot))
@@ -0,0 +1,35 @@
+import discord as dc
+from discord.ext import commands
+from utils.auditlog import AuditLogSink
+
+class logcommands(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.sink = AuditLogSink(bot)
+
+    async def cog_load(self):
+        self.sink.start()
+
+    async def cog_unload(self):
+        await self.sink.stop()
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: dc.abc.GuildChannel):
+        self.sink.channels.invalidate(channel.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: dc.abc.GuildChannel):
+        self.sink.channels.invalidate(channel.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: dc.abc.GuildChannel, after: dc.abc.GuildChannel):
+        if before.name != after.name:
+            self.sink.channels.invalidate(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: dc.Guild):
+        self.sink.channels.invalidate(guild.id)
+        self.sink.pending.pop(guild.id, None)
+
+async def setup(bot):
+    await bot.add_cog(logcommands(bot))
@@ -1,4 +1,3 @@
-import json
 import sys
 import discord as dc
 from discord import app_commands
@@ -6,35 +5,41 @@ from discord.ext import commands
 import asyncio
 import os
 from datetime import datetime
-
-#actual functions (for some reason they freak out if i put them inside the class.)
-QUOTE_DIR = "server_quotes"
-os.makedirs(QUOTE_DIR, exist_ok=True)
-
-def get_server_file(guild_id):
-    return os.path.join(QUOTE_DIR, f"{guild_id}.json")
-        
-def load_quotes(guild_id):
-    file_path = get_server_file(guild_id)
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                print(f"Invalid JSON in {file_path}. Resetting quotes.")
-                return []
-    else:
-        return []
-    
-def save_quotes(guild_id, quotes):
-    file_path = get_server_file(guild_id)
-    with open(file_path, "w") as f:
-         json.dump(quotes, f, indent=4)
+from utils.pagination import Paginator, shorten
+from utils.quotestore import SqliteQuoteStore, open_quote_store, migrate_json_quotes
+from utils.quoteindex import QuoteSearch
+from utils.auditlog import audit
 
 #actual commands.
 class quotecommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.store = open_quote_store()
+        #Under launcher.py the parent process has already imported them before starting the workers.
+        if isinstance(self.store, SqliteQuoteStore) and os.getenv("DA_SKIP_QUOTE_MIGRATION") != "1":
+            migrated = migrate_json_quotes(self.store)
+            if migrated:
+                print(f"Imported {migrated} quotes from the old JSON files")
+
+        self.search = QuoteSearch(self.store)
+        self.flush_task = None
+
+    async def cog_load(self):
+        if self.store.flush_interval:
+            self.flush_task = asyncio.create_task(self.flushQuotes())
+
+    async def cog_unload(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+        self.store.close()
+
+    async def flushQuotes(self):
+        while True:
+            await asyncio.sleep(self.store.flush_interval)
+            try:
+                await self.store.flush_async()
+            except Exception as e:
+                print(f"Couldn't flush saved quotes due to: {e}")
 
     @commands.Cog.listener()
     async def on_ready():
@@ -72,14 +77,14 @@ class quotecommands(commands.Cog):
                     return
                 else:
                     guild_id = interaction.guild.id
-                    quotes = load_quotes(guild_id)
-                    quotes.append({
+                    quote = {
                         "content": referenced_message.content,
                         "author": str(referenced_message.author),
                         "message_id": referenced_message.id,
                         "message_date": referenced_message.created_at.isoformat(),
-                    })
-                    save_quotes(guild_id, quotes)
+                    }
+                    self.store.add(guild_id, quote)
+                    self.search.added(guild_id, quote)
 
                     await interaction.followup.send(f"Quote saved: \"{referenced_message.content}\" - {referenced_message.author.mention}")
             except Exception as e:
@@ -91,29 +96,74 @@ class quotecommands(commands.Cog):
     @dc.app_commands.command(name="list_quotes", description="List all saved quotes for this server")
     async def listQuotes(self, interaction: dc.Interaction):
         guild_id = interaction.guild.id
-        quotes = load_quotes(guild_id)
+        total = self.store.count(guild_id)
 
-        if quotes:
-            quote_list = "\n".join(
-                [f"{idx + 1}. \"{quote['content']}\" - {quote['author']}" for idx, quote in enumerate(quotes)]
-            )
-            await interaction.response.send_message(f"Saved quotes:\n{quote_list}")
+        if total:
+            def render_page(start, stop, page, pages):
+                quotes = self.store.page(guild_id, start, stop - start)
+                quote_list = "\n".join(
+                    [f"{idx + 1}. \"{shorten(quote['content'], 300)}\" - {quote['author']}" for idx, quote in enumerate(quotes, start=start)]
+                )
+                embed = dc.Embed(title="Saved quotes", description=quote_list, color=dc.Color.blue())
+                embed.set_footer(text=f"Page {page + 1}/{pages} - {self.store.count(guild_id)} quote(s)")
+                return embed
+
+            paginator = Paginator(lambda: self.store.count(guild_id), render_page, author_id=interaction.user.id)
+            await paginator.send(interaction)
         else:
             await interaction.response.send_message("No quotes saved yet.")
 
     @dc.app_commands.command(name="remove_quote", description="Remove a quote by its index")
     async def removeQuote(self, interaction: dc.Interaction, index: int):
         guild_id = interaction.guild.id
-        quotes = load_quotes(guild_id)
+        removed = self.store.remove_at(guild_id, index - 1) if index > 0 else None
 
-        if 0 < index <= len(quotes):
-            removed = quotes.pop(index - 1)
-            save_quotes(guild_id, quotes)
+        if removed:
+            self.search.removed(guild_id, removed)
+            audit(self.bot, interaction.guild, f"{interaction.user} removed quote #{index}: \"{removed['content'][:200]}\" - {removed['author']}")
             await interaction.response.send_message(
                 f"Removed quote: \"{removed['content']}\" - {removed['author']}"
             )
         else:
             await interaction.response.send_message("Invalid quote index.")
 
+    @dc.app_commands.command(name="search_quotes", description="Search saved quotes by words, author or date (YYYY-MM-DD)")
+    async def searchQuotes(self, interaction: dc.Interaction, words: str = "", author: str = None, after: str = None, before: str = None):
+        try:
+            for day in (after, before):
+                if day:
+                    datetime.strptime(day, "%Y-%m-%d")
+        except ValueError:
+            await interaction.response.send_message("Dates need to look like YYYY-MM-DD.", ephemeral=True)
+            return
+
+        if not (words.strip() or author or after or before):
+            await interaction.response.send_message("Give me at least one thing to search for.", ephemeral=True)
+            return
+
+        matches = self.search.index(interaction.guild.id).search(words, author, after, before)
+        if not matches:
+            await interaction.response.send_message("No quotes matched your search.")
+            return
+
+        def render_page(start, stop, page, pages):
+            quote_list = "\n".join(
+                [f"\"{shorten(quote['content'], 300)}\" - {quote['author']} ({quote['message_date'][:10]})" for quote in matches[start:stop]]
+            )
+            embed = dc.Embed(title="Matching quotes", description=quote_list, color=dc.Color.blue())
+            embed.set_footer(text=f"Page {page + 1}/{pages} - {len(matches)} match(es)")
+            return embed
+
+        paginator = Paginator(lambda: len(matches), render_page, author_id=interaction.user.id)
+        await paginator.send(interaction)
+
+    @dc.app_commands.command(name="random_quote", description="Shows a random saved quote")
+    async def randomQuote(self, interaction: dc.Interaction):
+        quote = self.search.index(interaction.guild.id).random()
+        if quote:
+            await interaction.response.send_message(f"\"{quote['content']}\" - {quote['author']}")
+        else:
+            await interaction.response.send_message("No quotes saved yet.")
+
 async def setup(bot):
     await bot.add_cog(quotecommands(bot))
\ No newline at end of file
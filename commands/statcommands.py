@@ -0,0 +1,81 @@
+import discord as dc
+from discord import app_commands
+from discord.ext import commands
+from utils.metrics import Metrics, metrics_port, process_rss
+
+#Owns the metrics for this process. commands/__init__.py instruments the slash commands once every
+#cog is loaded, the gauges below read the other cogs' state whenever a report is built.
+class statcommands(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.metrics = Metrics()
+        self.metrics.gauge("da_guilds", "Guilds this process serves.", lambda: len(self.bot.guilds))
+        self.metrics.gauge("da_cached_members", "Members held in the member cache.", lambda: sum(len(guild.members) for guild in self.bot.guilds))
+        self.metrics.gauge("da_resident_memory_bytes", "Resident memory of this process.", process_rss)
+        self.metrics.gauge("da_resident_memory_per_guild_bytes", "Resident memory divided by guilds served.", self.rssPerGuild)
+        self.metrics.gauge("da_gateway_latency_seconds", "Heartbeat latency to Discord.", lambda: self.bot.latency)
+        self.metrics.gauge("da_voice_players", "Guild players that exist.", lambda: len(self.voice().players))
+        self.metrics.gauge("da_voice_playing", "Guilds currently playing audio.", self.voicePlaying)
+        self.metrics.gauge("da_ffmpeg_processes", "Live ffmpeg streams, playing, paused or pre-spawned.", self.ffmpegProcesses)
+        self.metrics.gauge("da_extraction_cache_hit_ratio", "Share of yt-dlp lookups served from cache.", lambda: self.voice().extractor.cache.stats()["hit_rate"])
+        self.metrics.gauge("da_timers_pending", "Timers waiting to fire.", lambda: len(self.bot.get_cog("timercommands").scheduler))
+        self.metrics.gauge("da_purges_running", "Purges currently running.", lambda: len(self.bot.get_cog("textcommands").purge_jobs))
+
+    async def cog_load(self):
+        await self.metrics.start(metrics_port(self.bot))
+
+    async def cog_unload(self):
+        await self.metrics.stop()
+
+    def voice(self):
+        return self.bot.get_cog("voicecommands")
+
+    def rssPerGuild(self):
+        rss = process_rss()
+        return rss // max(1, len(self.bot.guilds)) if rss is not None else None
+
+    def voicePlaying(self):
+        return sum(1 for player in self.voice().players.values() if player.voice_client and player.voice_client.is_playing())
+
+    def ffmpegProcesses(self):
+        count = 0
+        for player in self.voice().players.values():
+            if player.voice_client and (player.voice_client.is_playing() or player.voice_client.is_paused()):
+                count += 1
+            if player.prepared is not None:
+                count += 1
+        return count
+
+    @dc.app_commands.command(name="stats", description="Shows command latency, event loop lag and what the bot is running")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.guild_only()
+    async def stats(self, interaction: dc.Interaction):
+        metrics = self.metrics
+        embed = dc.Embed(title="Bot statistics", color=dc.Color.blue())
+
+        busiest = sorted(metrics.commands.items(), key=lambda item: item[1].latency.count, reverse=True)[:15]
+        command_lines = [
+            f"`/{name}` {stats.latency.count} calls, p50 ≤{stats.latency.quantile(0.5) * 1000:.0f}ms, "
+            f"p99 ≤{stats.latency.quantile(0.99) * 1000:.0f}ms, {stats.errors} errors"
+            + (f", {stats.in_flight} running" if stats.in_flight else "")
+            for name, stats in busiest if stats.latency.count or stats.in_flight
+        ]
+        embed.add_field(name="Commands", value="\n".join(command_lines) or "No commands run yet.", inline=False)
+
+        lag = metrics.loop_lag
+        embed.add_field(
+            name="Event loop lag",
+            value=f"Now {metrics.last_lag * 1000:.1f}ms, p99 ≤{lag.quantile(0.99) * 1000:.0f}ms, worst {lag.max * 1000:.0f}ms",
+            inline=False
+        )
+
+        gauges = metrics.read_gauges()
+        gauge_lines = [f"{name[3:].replace('_', ' ')}: {value:.2f}" if isinstance(value, float) else f"{name[3:].replace('_', ' ')}: {value}"
+                       for name, value in gauges.items()]
+        embed.add_field(name="Running", value="\n".join(gauge_lines) or "Nothing to report.", inline=False)
+
+        embed.set_footer(text=f"Prometheus endpoint on port {metrics_port(self.bot)}" if metrics.server else "Prometheus endpoint disabled (set DA_METRICS_PORT)")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def setup(bot):
+    await bot.add_cog(statcommands(bot))
@@ -4,10 +4,30 @@ from discord import app_commands
 from discord.ext import commands
 import asyncio
 import os
+from utils.auditlog import audit
+from utils.purge import PurgeJob, build_check
+
+PURGE_MAX = int(os.getenv("DA_PURGE_MAX", "10000"))
 
 class textcommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.purge_jobs = {}
+
+    async def cog_unload(self):
+        for job in list(self.purge_jobs.values()):
+            job.cancel()
+
+    async def cog_app_command_error(self, interaction: dc.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, (app_commands.MissingPermissions, app_commands.BotMissingPermissions)):
+            who = "You need" if isinstance(error, app_commands.MissingPermissions) else "I need"
+            message = f"{who} the {', '.join(error.missing_permissions).replace('_', ' ')} permission for this."
+            if interaction.response.is_done():
+                await interaction.followup.send(message, ephemeral=True)
+            else:
+                await interaction.response.send_message(message, ephemeral=True)
+            return
+        print(f"Command {interaction.command.name if interaction.command else '?'} failed due to: {error}")
 
     @commands.Cog.listener()
     async def on_ready():
@@ -35,27 +55,54 @@ class textcommands(commands.Cog):
         time = self.bot.latency * 1000
         await interaction.response.send_message(f'My ping returned after: {time: .2f}ms')
 
-    @dc.app_commands.command(name="purge", description="Purges the last specified amount of messages from the channel")
-    async def purgeMessage(self, interaction: dc.Interaction, amount: int):
-        try:
-            if(amount <= 0):
-                await interaction.response.send_message("Please enter a valid amount of messages")
-                return
-            elif (amount > 50):
-                await interaction.response.send_message("Please enter a smaller amount of messages")
-                return
-            
-            await interaction.response.defer(ephemeral=True)
+    @dc.app_commands.command(name="purge", description="Purges matching messages among the last specified amount in the channel")
+    @app_commands.default_permissions(manage_messages=True)
+    @app_commands.guild_only()
+    @app_commands.checks.has_permissions(manage_messages=True)
+    @app_commands.checks.bot_has_permissions(manage_messages=True, read_message_history=True)
+    async def purgeMessage(self, interaction: dc.Interaction, amount: int, user: dc.User = None, contains: str = None, bots: bool = False):
+        if(amount <= 0):
+            await interaction.response.send_message("Please enter a valid amount of messages")
+            return
+        elif (amount > PURGE_MAX):
+            await interaction.response.send_message(f"Please enter a smaller amount of messages (at most {PURGE_MAX})")
+            return
 
-            deleted = await interaction.channel.purge(limit=amount)
+        channel = interaction.channel
+        if channel.id in self.purge_jobs:
+            await interaction.response.send_message("A purge is already running in this channel, use `/purge_cancel` to stop it.", ephemeral=True)
+            return
 
-        except Exception as e:
-            print(f"Couldn't purge {amount} messages in {interaction.channel} due to {e}")
+        await interaction.response.send_message(f"Purging up to {amount} messages...", ephemeral=True)
+
+        async def progress(job):
+            #The interaction token only lives for 15 minutes, after that progress just goes to the console.
+            try:
+                await interaction.edit_original_response(content=job.summary())
+            except dc.HTTPException:
+                print(f"[#{channel}] {job.summary()}")
+
+        job = PurgeJob(channel, amount, build_check(user, contains, bots), progress)
+        self.purge_jobs[channel.id] = job
+        task = job.start()
+        task.add_done_callback(lambda _: self.finishPurge(interaction, job))
+
+    def finishPurge(self, interaction: dc.Interaction, job: PurgeJob):
+        self.purge_jobs.pop(job.channel.id, None)
+        audit(self.bot, interaction.guild, f"{interaction.user} purged {job.deleted} messages in #{job.channel.name}" + (" (cancelled)" if job.cancelled else ""))
 
-        log_channel = dc.utils.get(interaction.guild.text_channels, name="da-logs")
-        if log_channel:
-            await log_channel.send(f"{interaction.user} requested the deletion of {len(deleted)} messages in #{interaction.channel.name}")
-        await interaction.response.send_message(f"Successfully deleted {len(deleted) - 1} messages.")
+    @dc.app_commands.command(name="purge_cancel", description="Stops the purge running in this channel")
+    @app_commands.default_permissions(manage_messages=True)
+    @app_commands.guild_only()
+    @app_commands.checks.has_permissions(manage_messages=True)
+    @app_commands.checks.bot_has_permissions(manage_messages=True, read_message_history=True)
+    async def purgeCancel(self, interaction: dc.Interaction):
+        job = self.purge_jobs.get(interaction.channel.id)
+        if job is None:
+            await interaction.response.send_message("There is no purge running in this channel.", ephemeral=True)
+            return
+        job.cancel()
+        await interaction.response.send_message(f"Stopping the purge, {job.deleted} messages were deleted so far.", ephemeral=True)
 
 async def setup(bot):
     await bot.add_cog(textcommands(bot))
\ No newline at end of file
@@ -1,13 +1,66 @@
 import sys
+import time
 import discord as dc
 from discord import app_commands
 from discord.ext import commands
-import asyncio  
+from utils.scheduler import DeadlineScheduler
+from utils.timerstore import TimerStore
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h:{seconds % 3600 // 60:02d}m:{seconds % 60:02d}s"
+
+class Timer:
+    __slots__ = ("id", "user_id", "channel_id", "call")
+
+    def __init__(self, timer_id, user_id, channel_id):
+        self.id = timer_id
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.call = None
 
 class timercommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.timers = {}
+        #Every timer of every user shares this one scheduler task instead of sleeping in its own.
+        self.scheduler = DeadlineScheduler("timers")
+        self.store = TimerStore()
+
+    #With several worker processes sharing the timer table, each only restores timers for its own shards.
+    def ownsGuild(self, guild_id):
+        shard_count = self.bot.shard_count
+        shard_ids = getattr(self.bot, "shard_ids", None)
+        if not shard_count or shard_ids is None:
+            return True
+        return ((guild_id or 0) >> 22) % shard_count in shard_ids
+
+    async def cog_load(self):
+        started = time.perf_counter()
+        timers = []
+        for timer_id, user_id, guild_id, channel_id, due in self.store.load():
+            if not self.ownsGuild(guild_id):
+                continue
+            timer = Timer(timer_id, user_id, channel_id)
+            self.timers.setdefault(user_id, []).append(timer)
+            timers.append((due, timer))
+
+        calls = self.scheduler.call_many((due, self.finishTimer, timer) for due, timer in timers)
+        for (due, timer), call in zip(timers, calls):
+            timer.call = call
+        print(f"Restored {len(timers)} timers in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        #Overdue timers fire straight away, so hold off until the bot can actually send messages.
+        if self.bot.is_ready():
+            self.scheduler.start()
+
+    async def cog_unload(self):
+        self.scheduler.stop()
+        self.store.close()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.scheduler.start()
 
     @dc.app_commands.command(name="start_timer", description="Start a timer.")
     async def timerStart(self, interaction: dc.Interaction, h: int = 0, m: int = 0, s: int = 0):
@@ -23,36 +76,36 @@ class timercommands(commands.Cog):
             if user_id not in self.timers:
                 self.timers[user_id] = []
 
-            if len(self.timers[user_id]) >= 3:
+            if self.store.count_user(user_id) >= 3:
                 await interaction.response.send_message("You already have 3 active timers, relax.")
                 return
     
             await interaction.response.send_message(f'Started a timer for {h}h:{m}m:{s}s')
 
-            if user_id not in self.timers:
-                self.timers[user_id] = []
-
-            timer_task = self.bot.loop.create_task(self.run_timer(interaction, duration))
-            self.timers[user_id].append(timer_task)
+            due = time.time() + duration
+            guild_id = interaction.guild.id if interaction.guild else None
+            timer = Timer(self.store.add(user_id, guild_id, interaction.channel_id, due), user_id, interaction.channel_id)
+            timer.call = self.scheduler.call_at(due, self.finishTimer, timer)
+            self.timers[user_id].append(timer)
         except Exception as e:
             print(f"Error starting timer: {e}")
             await interaction.response.send_message("An error occurred while starting the timer.", ephemeral=True)
-    
-    async def run_timer(self, interaction: dc.Interaction, duration: int):
-        user_id = interaction.user.id
 
+    def forgetTimer(self, timer):
+        self.store.remove(timer.id)
+        timers = self.timers.get(timer.user_id)
+        if timers and timer in timers:
+            timers.remove(timer)
+            if not timers:
+                del self.timers[timer.user_id]
+
+    async def finishTimer(self, timer):
+        self.forgetTimer(timer)
         try:
-            await asyncio.sleep(duration)
-            await interaction.followup.send(content=f"Time's up, {interaction.user.mention}.")
-        except asyncio.CancelledError:
-            await interaction.followup.send(content="The timer was canceled.")
-        finally:
-            if user_id in self.timers:
-                current_task = asyncio.current_task()
-                self.timers[user_id] = [t for t in self.timers[user_id] if t is not current_task]
-                
-                if not self.timers[user_id]:
-                    del self.timers[user_id]
+            channel = self.bot.get_channel(timer.channel_id) or await self.bot.fetch_channel(timer.channel_id)
+            await channel.send(content=f"Time's up, <@{timer.user_id}>.")
+        except dc.HTTPException as e:
+            print(f"Couldn't deliver timer {timer.id} to channel {timer.channel_id} due to {e}")
 
     @dc.app_commands.command(name="cancel_timers", description="Cancels all your active timers.")
     async def cancelTimers(self, interaction: dc.Interaction):
@@ -62,10 +115,11 @@ class timercommands(commands.Cog):
             await interaction.response.send_message("You don't have any active timers.")
             return
 
-        for timer in self.timers[user_id]:
-            timer.cancel()
+        timers = self.timers.pop(user_id)
+        for timer in timers:
+            self.scheduler.cancel(timer.call)
+        self.store.remove_many(timer.id for timer in timers)
 
-        del self.timers[user_id]
         await interaction.response.send_message("Stopped your active timers.")
 
     @dc.app_commands.command(name="list_timers", description="Lists all your active timers.")
@@ -76,8 +130,11 @@ class timercommands(commands.Cog):
             await interaction.response.send_message("You don't have any active timers.")
             return
 
-        timer_count = len(self.timers[user_id])
-        await interaction.response.send_message(f"You have {timer_count} active timer(s).")
+        timers = sorted(self.timers[user_id], key=lambda timer: timer.call.due)
+        timer_list = "\n".join(
+            f"{i}. {format_duration(timer.call.remaining())} left" for i, timer in enumerate(timers, start=1)
+        )
+        await interaction.response.send_message(f"You have {len(timers)} active timer(s):\n{timer_list}")
 
 
 async def setup(bot):
@@ -1,126 +1,105 @@
-from datetime import datetime, timedelta
 import sys
 import nacl
 import traceback
-import yt_dlp as ytdl
 import re
 import discord as dc
-from discord import opus
 from discord import app_commands
 from discord.ext import commands
-import asyncio
-import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils.extractor import ExtractionPool, YDL_OPTS, pick_audio_format
+from utils.player import GuildPlayer, PREBUFFER_WORKERS
+from utils.scheduler import DeadlineScheduler
+from utils.audiocache import AudioCache
+from utils.trackqueue import Track
+from utils.pagination import Paginator, shorten
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('voicecommands')
 
-YDL_OPTS = {
-    'format': 'bestaudio/best',
-    'quiet': True,
-    'no_warnings': True,
-    'extract_flat': False,
-    'default_search': 'ytsearch',
-}
-
-current_directory = os.path.dirname(os.path.abspath(__file__))
-parent_directory = os.path.abspath(os.path.join(current_directory, ".."))
-dll_path = os.path.join(parent_directory, "libopus-0.dll")
-
-if not os.path.exists(dll_path):
-    raise FileNotFoundError(f"Opus library not found at {dll_path}")
-else:
-    dc.opus.load_opus(dll_path)
-
-if dc.opus.is_loaded():
-    logger.info("Opus library loaded successfully")
-else:
-    logger.error("Failed to load Opus library")
-
 class voicecommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.last_activity_time = None
-        self.voice_channel = None
-        self.voice_client = None
-        self.inactivity_task = None
-        self.queue = []
-        self.current_track = None
-        self.is_moving = False  # Flag to indicate if the bot is moving voice channels
-
-    async def inactivityAutoLeave(self):
-        while self.voice_client and self.voice_client.is_connected():
-            if self.last_activity_time and datetime.utcnow() - self.last_activity_time > timedelta(minutes=2):
-                await self.voice_client.disconnect()
-                logger.info("Disconnected due to inactivity.")
-                self.voice_client = None
-                self.last_activity_time = None
-                return
-            await asyncio.sleep(30)
-
-    def after_play(self, error):
-        if error:
-            logger.error(f"Player error: {error}")
-
-        # Only proceed if not moving to another voice channel
-        if not self.is_moving:
-            coro = self.play_next()
-            future = asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
-            try:
-                future.result()
-            except Exception as e:
-                logger.error(f"Error in after_play coroutine: {e}")
-
-    async def play_next(self):
-        if not self.queue or not self.voice_client or not self.voice_client.is_connected():
-            self.current_track = None
-            logger.info("No more tracks in the queue or voice client disconnected.")
+        self.players = {}
+        self.extractor = ExtractionPool()
+        #One deadline scheduler handles idle disconnects and track pre-spawning for every guild.
+        self.scheduler = DeadlineScheduler("voice")
+        self.audio_cache = AudioCache()
+        self.prebuffer = ThreadPoolExecutor(max_workers=PREBUFFER_WORKERS, thread_name_prefix="prebuffer")
+
+    async def cog_load(self):
+        self.scheduler.start()
+
+    async def cog_unload(self):
+        for player in list(self.players.values()):
+            await player.disconnect()
+        self.scheduler.stop()
+        self.audio_cache.stop()
+        self.extractor.shutdown()
+        self.prebuffer.shutdown(wait=False, cancel_futures=True)
+
+    #Players are created the first time a guild needs one and dropped again once they disconnect.
+    def get_player(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is None:
+            player = GuildPlayer(self.bot, guild_id, self.extractor, self.scheduler, self.audio_cache, self.prebuffer, self.release_player)
+            self.players[guild_id] = player
+        return player
+
+    def release_player(self, player):
+        if self.players.get(player.guild_id) is player:
+            del self.players[player.guild_id]
+            logger.info(f"Released player for guild {player.guild_id} ({len(self.players)} active)")
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: dc.Member, before: dc.VoiceState, after: dc.VoiceState):
+        player = self.players.get(member.guild.id)
+        if player is None or player.is_moving:
             return
 
-        track = self.queue.pop(0)
-        self.current_track = track
-
-        self.last_activity_time = datetime.utcnow()
+        if member.id == self.bot.user.id:
+            # Kicked or disconnected from outside the bot, clean up so ffmpeg doesn't linger
+            if after.channel is None and player.voice_client is not None and not player.voice_client.is_connected():
+                await player.disconnect()
+            return
 
-        audio_source = dc.FFmpegPCMAudio(
-            track['source_url'],
-            before_options='-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
-        )
-        self.voice_client.play(audio_source, after=self.after_play)
-        logger.info(f"Now playing: {track['title']}")
+        if not player.is_connected():
+            return
+        channel_id = player.voice_client.channel.id
+        if (before.channel and before.channel.id == channel_id) or (after.channel and after.channel.id == channel_id):
+            player.refresh_idle()
 
-    def extract_info(self, query: str):
+    async def extract_info(self, query: str):
         ydl_opts = YDL_OPTS.copy()
 
         youtube_pattern = re.compile(r"(youtube\.com|youtu\.be)")
 
         if youtube_pattern.search(query):
             if "list=" in query:
-                ydl_opts['extract_flat'] = False
-                with ytdl.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(query, download=False)
-                    if 'entries' in info:
-                        logger.info(f"Extracted {len(info['entries'])} tracks from playlist")
-                        return info['entries'], True
-                    else:
-                        logger.info("Extracted a single track from playlist URL")
-                        return [info], False
-            else:
-                with ytdl.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(query, download=False)
-                    logger.info(f"Extracted single track: {info.get('title', 'Unknown title')}")
+                # Only titles and links are needed up front, stream URLs are resolved lazily by play_next
+                ydl_opts['extract_flat'] = 'in_playlist'
+                info = await self.extractor.extract(query, ydl_opts)
+                if 'entries' in info:
+                    logger.info(f"Extracted {len(info['entries'])} tracks from playlist")
+                    return info['entries'], True
+                else:
+                    logger.info("Extracted a single track from playlist URL")
                     return [info], False
+            else:
+                info = await self.extractor.extract(query, ydl_opts)
+                logger.info(f"Extracted single track: {info.get('title', 'Unknown title')}")
+                return [info], False
         else:
             search_query = f"ytsearch:{query}"
-            with ytdl.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(search_query, download=False)
-                if 'entries' in info and info['entries']:
-                    logger.info(f"Extracted search result: {info['entries'][0].get('title', 'Unknown title')}")
-                    return [info['entries'][0]], False
-                else:
-                    logger.info("No search results found")
-                    return [], False
+            ydl_opts['extract_flat'] = 'in_playlist'
+            info = await self.extractor.extract(search_query, ydl_opts)
+            if 'entries' in info and info['entries']:
+                logger.info(f"Extracted search result: {info['entries'][0].get('title', 'Unknown title')}")
+                return [info['entries'][0]], False
+            else:
+                logger.info("No search results found")
+                return [], False
 
     @dc.app_commands.command(name="join_vc", description="Joins the voice channel you are currently connected to")
     async def joinVC(self, interaction: dc.Interaction):
@@ -131,40 +110,17 @@ class voicecommands(commands.Cog):
                 return
 
             user_voice_channel = interaction.user.voice.channel
+            player = self.get_player(interaction.guild.id)
 
-            if self.voice_client:
-                if self.voice_client.channel.id == user_voice_channel.id:
+            if player.voice_client:
+                if player.voice_client.channel.id == user_voice_channel.id:
                     await interaction.followup.send("I'm already in your voice channel!", ephemeral=True)
                     return
-                else:
-                    self.is_moving = True  # Indicate that the bot is moving
-                    # Pause current playback if any
-                    if self.voice_client.is_playing():
-                        self.voice_client.pause()
-                        logger.info("Paused current playback before moving.")
-                    await self.voice_client.disconnect()
-                    self.voice_client = None
-                    logger.info("Disconnected from the previous voice channel.")
-                    self.is_moving = False  # Reset the moving flag
-
-            self.voice_channel = user_voice_channel
-            self.voice_client = await self.voice_channel.connect()
-            logger.info(f"Connected to voice channel: {self.voice_channel.name}")
-            self.last_activity_time = datetime.utcnow()
-
-            if self.inactivity_task is None or self.inactivity_task.done():
-                self.inactivity_task = asyncio.create_task(self.inactivityAutoLeave())
-
-            # Resume playback if there was a track paused
-            if self.current_track and not self.voice_client.is_playing():
-                audio_source = dc.FFmpegPCMAudio(
-                    self.current_track['source_url'],
-                    before_options='-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
-                )
-                self.voice_client.play(audio_source, after=self.after_play)
-                logger.info(f"Resumed playing: {self.current_track['title']}")
+                await player.move_to(user_voice_channel)
+            else:
+                await player.connect(user_voice_channel)
 
-            await interaction.followup.send(f"Joined {self.voice_channel.name}!", ephemeral=True)
+            await interaction.followup.send(f"Joined {player.voice_channel.name}!", ephemeral=True)
 
         except Exception as e:
             logger.error(f"Couldn't join VC: {e}")
@@ -173,12 +129,10 @@ class voicecommands(commands.Cog):
     @dc.app_commands.command(name="leave_vc", description="Leaves the voice channel the bot is currently connected to")
     async def leaveVC(self, interaction: dc.Interaction):
         await interaction.response.send_message("Leaving voice channel...", ephemeral=True)
-        if self.voice_client and self.voice_client.is_connected():
-            await self.voice_client.disconnect()
+        player = self.players.get(interaction.guild.id)
+        if player and player.is_connected():
+            await player.disconnect()
             logger.info("Left the voice channel.")
-            self.voice_client = None
-            self.last_activity_time = None
-            self.current_track = None  # Optionally, you can set current_track to None
             await interaction.followup.send("Left the voice channel.", ephemeral=True)
         else:
             await interaction.followup.send("I am not connected to any voice channel.", ephemeral=True)
@@ -193,51 +147,37 @@ class voicecommands(commands.Cog):
                 return
 
             user_voice_channel = interaction.user.voice.channel
+            player = self.get_player(interaction.guild.id)
 
-            if not self.voice_client or not self.voice_client.is_connected():
-                self.voice_channel = user_voice_channel
-                self.voice_client = await self.voice_channel.connect()
-                logger.info(f"Connected to voice channel: {self.voice_channel.name}")
-                self.last_activity_time = datetime.utcnow()
-
-                if self.inactivity_task is None or self.inactivity_task.done():
-                    self.inactivity_task = asyncio.create_task(self.inactivityAutoLeave())
-
-                await interaction.followup.send(f"Joined {self.voice_channel.name} and added the track to the queue.", ephemeral=True)
+            if not player.is_connected():
+                await player.connect(user_voice_channel)
+                await interaction.followup.send(f"Joined {player.voice_channel.name} and added the track to the queue.", ephemeral=True)
             else:
                 # Optionally, you can check if the bot is in the same channel as the user
-                if self.voice_client.channel.id != user_voice_channel.id:
+                if player.voice_client.channel.id != user_voice_channel.id:
                     await interaction.followup.send("I'm already connected to another voice channel. Use `/join_vc` to move me.", ephemeral=True)
                     return
 
-            results, is_playlist = self.extract_info(input)
+            results, is_playlist = await self.extract_info(input)
             if not results:
                 await interaction.followup.send("No results found for that query.")
                 return
 
+            tracks = []
             for entry in results:
-                # Use yt_dlp to get the direct audio URL
-                with ytdl.YoutubeDL(YDL_OPTS) as ydl:
-                    info = ydl.extract_info(entry['webpage_url'], download=False)
-                    # Choose the best audio format available
-                    formats = info.get('formats', [])
-                    audio_format = next((f for f in formats if f.get('acodec') != 'none'), None)
-                    if not audio_format:
-                        await interaction.followup.send(f"Couldn't find a suitable audio format for {entry.get('title', 'Unknown Title')}.")
-                        continue
-                    audio_url = audio_format['url']
-
-                track = {
-                    "title": entry.get("title", "Unknown title"),
-                    "url": entry.get("webpage_url", ""),
-                    "requester": interaction.user.display_name,
-                    "source_url": audio_url
-                }
-                self.queue.append(track)
-                logger.info(f"Added to queue: {track['title']}")
-
-            if self.current_track is None and not self.voice_client.is_playing():
-                await self.play_next()
+                track = Track(
+                    entry.get("title", "Unknown title"),
+                    entry.get("webpage_url") or entry.get("url", ""),
+                    interaction.user.display_name,
+                    entry.get("duration")
+                )
+                # Single videos come back fully extracted, flat playlist entries get resolved when they come up
+                audio_format = pick_audio_format(entry) if 'formats' in entry else None
+                if audio_format:
+                    track.set_format(audio_format)
+                tracks.append(track)
+            logger.info(f"Added {len(tracks)} track(s) to the queue of guild {interaction.guild.id}")
+            await player.enqueue(tracks)
 
             if is_playlist:
                 await interaction.followup.send(f"Added a playlist with {len(results)} tracks to the queue.")
@@ -251,8 +191,9 @@ class voicecommands(commands.Cog):
 
     @dc.app_commands.command(name="skip", description="Skips the current track")
     async def skip(self, interaction: dc.Interaction):
-        if self.voice_client and self.voice_client.is_playing():
-            self.voice_client.stop()
+        player = self.players.get(interaction.guild.id)
+        if player and player.voice_client and player.voice_client.is_playing():
+            player.voice_client.stop()
             await interaction.response.send_message("Skipped the current track.")
             logger.info("Skipped the current track.")
         else:
@@ -260,8 +201,9 @@ class voicecommands(commands.Cog):
 
     @dc.app_commands.command(name="pause", description="Pauses the current track")
     async def pause(self, interaction: dc.Interaction):
-        if self.voice_client and self.voice_client.is_playing():
-            self.voice_client.pause()
+        player = self.players.get(interaction.guild.id)
+        if player and player.voice_client and player.voice_client.is_playing():
+            player.pause()
             await interaction.response.send_message("Paused the current track.")
             logger.info("Paused the current track.")
         else:
@@ -269,8 +211,9 @@ class voicecommands(commands.Cog):
 
     @dc.app_commands.command(name="resume", description="Resumes the current track")
     async def resume(self, interaction: dc.Interaction):
-        if self.voice_client and self.voice_client.is_paused():
-            self.voice_client.resume()
+        player = self.players.get(interaction.guild.id)
+        if player and player.voice_client and player.voice_client.is_paused():
+            player.resume()
             await interaction.response.send_message("Resumed the current track.")
             logger.info("Resumed the current track.")
         else:
@@ -278,49 +221,86 @@ class voicecommands(commands.Cog):
 
     @dc.app_commands.command(name="clear", description="Stops playback and clears the queue")
     async def clear(self, interaction: dc.Interaction):
-        self.queue.clear()
-        if self.voice_client and self.voice_client.is_playing():
-            self.voice_client.stop()
-        self.current_track = None
+        player = self.players.get(interaction.guild.id)
+        if player:
+            player.clear()
         await interaction.response.send_message("Stopped playback and cleared the queue.")
         logger.info("Cleared the queue and stopped playback.")
 
     @dc.app_commands.command(name="queue", description="Displays the current queue")
     async def queue_cmd(self, interaction: dc.Interaction):
-        if not self.current_track and not self.queue:
+        player = self.players.get(interaction.guild.id)
+        if not player or (not player.current_track and not player.queue):
             await interaction.response.send_message("The queue is empty.", ephemeral=True)
             return
 
-        embed = dc.Embed(title="Music Queue", color=dc.Color.blue())
+        def render_page(start, stop, page, pages):
+            embed = dc.Embed(title="Music Queue", color=dc.Color.blue())
 
-        if self.current_track:
-            embed.add_field(
-                name="Now Playing",
-                value=f"**{self.current_track['title']}**\nRequested by: {self.current_track['requester']}",
-                inline=False
-            )
-        else:
-            embed.add_field(name="Now Playing", value="Nothing currently playing.", inline=False)
+            if player.current_track:
+                embed.add_field(
+                    name="Now Playing",
+                    value=f"**{shorten(player.current_track.title, 200)}**\nRequested by: {shorten(player.current_track.requester, 20)}",
+                    inline=False
+                )
+            else:
+                embed.add_field(name="Now Playing", value="Nothing currently playing.", inline=False)
+
+            #The page goes in the description (4096 characters), a field's 1024 can't hold 10 long titles.
+            tracks = player.queue.slice(start, stop)
+            if tracks:
+                embed.description = "**Up Next**\n" + "\n".join(
+                    f"{i}. **{shorten(track.title, 60)}** (Requested by: {shorten(track.requester, 20)})"
+                    for i, track in enumerate(tracks, start=start + 1)
+                )
+            else:
+                embed.description = "The queue is empty."
 
-        if self.queue:
-            queue_description = ""
-            for i, track in enumerate(self.queue, start=1):
-                queue_description += f"{i}. **{track['title']}** (Requested by: {track['requester']})\n"
-            embed.add_field(name="Up Next", value=queue_description, inline=False)
-        else:
-            embed.add_field(name="Queue", value="The queue is empty.", inline=False)
+            embed.set_footer(text=f"Page {page + 1}/{pages} - {len(player.queue)} track(s) queued")
+            return embed
 
-        await interaction.response.send_message(embed=embed)
+        paginator = Paginator(lambda: len(player.queue), render_page, author_id=interaction.user.id)
+        await paginator.send(interaction)
 
     @dc.app_commands.command(name="remove", description="Removes a track from the queue by its index")
     async def remove(self, interaction: dc.Interaction, index: int):
+        player = self.players.get(interaction.guild.id)
         index = index - 1
-        if 0 <= index < len(self.queue):
-            removed = self.queue.pop(index)
-            await interaction.response.send_message(f"Removed **{removed['title']}** from the queue.")
-            logger.info(f"Removed track from queue: {removed['title']}")
+        if player and 0 <= index < len(player.queue):
+            removed = player.queue.remove_at(index)
+            await interaction.response.send_message(f"Removed **{removed.title}** from the queue.")
+            logger.info(f"Removed track from queue: {removed.title}")
         else:
             await interaction.response.send_message("Invalid track index.")
 
+    @dc.app_commands.command(name="move", description="Moves a track to another position in the queue")
+    async def move(self, interaction: dc.Interaction, index: int, position: int):
+        player = self.players.get(interaction.guild.id)
+        if player and 0 < index <= len(player.queue) and 0 < position <= len(player.queue):
+            moved = player.queue.move(index - 1, position - 1)
+            player.prefetch_upcoming()
+            await interaction.response.send_message(f"Moved **{moved.title}** to position {position}.")
+            logger.info(f"Moved track {moved.title} to position {position}")
+        else:
+            await interaction.response.send_message("Invalid track index.")
+
+    @dc.app_commands.command(name="shuffle", description="Shuffles the queue")
+    async def shuffle(self, interaction: dc.Interaction):
+        player = self.players.get(interaction.guild.id)
+        if player and player.queue:
+            player.queue.shuffle()
+            player.prefetch_upcoming()
+            await interaction.response.send_message(f"Shuffled {len(player.queue)} tracks.")
+            logger.info("Shuffled the queue.")
+        else:
+            await interaction.response.send_message("The queue is empty.")
+
+    @dc.app_commands.command(name="dedupe", description="Removes duplicate tracks from the queue")
+    async def dedupe(self, interaction: dc.Interaction):
+        player = self.players.get(interaction.guild.id)
+        removed = player.queue.dedupe() if player else 0
+        await interaction.response.send_message(f"Removed {removed} duplicate track(s) from the queue.")
+        logger.info(f"Removed {removed} duplicate tracks from the queue.")
+
 async def setup(bot):
     await bot.add_cog(voicecommands(bot))
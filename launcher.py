@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing as mp
+import os
+import signal
+import time
+import aiohttp
+
+#Runs app.py's run() in several worker processes, each owning a slice of the bot's shards,
+#and restarts any worker that dies. `python launcher.py` to start, app.py alone still runs a single process.
+WORKERS = int(os.getenv("DA_WORKERS", str(os.cpu_count() or 1)))
+#Leave unset to ask Discord for the recommended amount.
+SHARD_COUNT = os.getenv("DA_SHARD_COUNT")
+#Discord allows one identify per 5 seconds by default, workers are started far enough apart to respect it.
+IDENTIFY_INTERVAL = float(os.getenv("DA_IDENTIFY_INTERVAL", "5"))
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+#A worker that stayed up this long is considered healthy again and its backoff resets.
+HEALTHY_UPTIME = 600
+
+async def recommended_shards(token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+#Contiguous shard ranges, as even as possible.
+def split_shards(shard_count, workers):
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    groups = []
+    start = 0
+    for i in range(workers):
+        stop = start + size + (1 if i < extra else 0)
+        groups.append(list(range(start, stop)))
+        start = stop
+    return groups
+
+def worker_main(shard_ids, shard_count):
+    os.environ["DA_SHARD_COUNT"] = str(shard_count)
+    os.environ["DA_SHARD_IDS"] = ",".join(str(shard_id) for shard_id in shard_ids)
+    import app
+    asyncio.run(app.run())
+
+class Worker:
+    def __init__(self, shard_ids):
+        self.shard_ids = shard_ids
+        self.process = None
+        self.started = 0
+        self.restart_delay = RESTART_DELAY
+        self.restart_at = None
+
+    @property
+    def name(self):
+        return f"shards {self.shard_ids[0]}-{self.shard_ids[-1]}"
+
+def supervise(groups, shard_count):
+    context = mp.get_context("spawn")
+    workers = [Worker(group) for group in groups]
+    stopping = False
+
+    def spawn(worker):
+        worker.process = context.Process(target=worker_main, args=(worker.shard_ids, shard_count), name=worker.name)
+        worker.process.start()
+        worker.started = time.monotonic()
+        worker.restart_at = None
+        print(f"Started worker for {worker.name} (pid {worker.process.pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for worker in workers:
+        if stopping:
+            break
+        spawn(worker)
+        time.sleep(IDENTIFY_INTERVAL * len(worker.shard_ids))
+
+    while not stopping:
+        running = 0
+        for worker in workers:
+            if worker.process is None:
+                continue
+            if worker.process.is_alive():
+                running += 1
+                continue
+
+            if worker.restart_at is None:
+                code = worker.process.exitcode
+                if code == 0:
+                    #Clean exit (e.g. /quit), don't bring it back.
+                    print(f"Worker for {worker.name} exited cleanly.")
+                    worker.process = None
+                    continue
+                if time.monotonic() - worker.started > HEALTHY_UPTIME:
+                    worker.restart_delay = RESTART_DELAY
+                print(f"Worker for {worker.name} died with code {code}, restarting in {worker.restart_delay}s")
+                worker.restart_at = time.monotonic() + worker.restart_delay
+                worker.restart_delay = min(worker.restart_delay * 2, MAX_RESTART_DELAY)
+
+            running += 1
+            if time.monotonic() >= worker.restart_at:
+                spawn(worker)
+
+        if not running:
+            break
+        time.sleep(1)
+
+    for worker in workers:
+        if worker.process is not None and worker.process.is_alive():
+            worker.process.terminate()
+    for worker in workers:
+        if worker.process is not None:
+            worker.process.join(timeout=30)
+    print("All workers stopped.")
+
+#The one-shot JSON quote import runs here, before any worker exists. Left to the workers, two of them
+#could read the same file before either renamed it and import its quotes twice.
+def migrate_quotes():
+    from utils.quotestore import QUOTE_BACKEND, SqliteQuoteStore, migrate_json_quotes
+    if QUOTE_BACKEND == "json":
+        return
+    store = SqliteQuoteStore()
+    try:
+        migrated = migrate_json_quotes(store)
+        if migrated:
+            print(f"Imported {migrated} quotes from the old JSON files")
+    finally:
+        store.close()
+    #Inherited by the spawned workers.
+    os.environ["DA_SKIP_QUOTE_MIGRATION"] = "1"
+
+def main():
+    migrate_quotes()
+    if SHARD_COUNT:
+        shard_count = int(SHARD_COUNT)
+    else:
+        import GitIgnorables.Authcode as Authcode
+        shard_count = asyncio.run(recommended_shards(Authcode.token))
+    groups = split_shards(shard_count, WORKERS)
+    print(f"Running {shard_count} shards across {len(groups)} worker processes")
+    supervise(groups, shard_count)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import time
+import logging
+from collections import deque
+import discord as dc
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger('audio')
+
+#Stream Opus sources straight through to Discord instead of decoding to PCM and re-encoding in Python.
+OPUS_PASSTHROUGH = os.getenv("DA_OPUS_PASSTHROUGH", "1") != "0"
+
+#Logs how much CPU a stream cost once it ends: the ffmpeg process (needs psutil) and
+#the audio player thread that reads, encodes and sends the packets.
+class MeteredAudio:
+    def init_meter(self, label, mode):
+        self.label = label
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.thread_start = None
+        self.thread_last = None
+        self.reported = False
+
+    #Pre-spawned sources are primed from an executor thread before they play, the meter starts over
+    #once the AudioPlayer thread takes them so neither wall time nor thread CPU mixes the two.
+    def reset_meter(self):
+        self.started = time.perf_counter()
+        self.thread_start = None
+        self.thread_last = None
+
+    def read(self):
+        now = time.thread_time()
+        if self.thread_start is None:
+            self.thread_start = now
+        self.thread_last = now
+        return super().read()
+
+    def cleanup(self):
+        ffmpeg_cpu = None
+        process = getattr(self, '_process', None)
+        if psutil is not None and process is not None:
+            try:
+                times = psutil.Process(process.pid).cpu_times()
+                ffmpeg_cpu = times.user + times.system
+            except psutil.Error:
+                pass
+        super().cleanup()
+
+        #The AudioPlayer cleans up when the stream ends and AudioSource.__del__ does it again, report once.
+        if self.reported:
+            return
+        self.reported = True
+        wall = time.perf_counter() - self.started
+        if wall <= 0:
+            return
+        usage = f"[{self.label}] {self.mode} stream ended after {wall:.0f}s"
+        if ffmpeg_cpu is not None:
+            usage += f", ffmpeg {ffmpeg_cpu:.2f}s CPU ({ffmpeg_cpu / wall * 100:.1f}%)"
+        if self.thread_start is not None:
+            player_cpu = self.thread_last - self.thread_start
+            usage += f", player thread {player_cpu:.2f}s CPU ({player_cpu / wall * 100:.1f}%)"
+        logger.info(usage)
+
+class MeteredPCMAudio(MeteredAudio, dc.FFmpegPCMAudio):
+    pass
+
+class MeteredOpusAudio(MeteredAudio, dc.FFmpegOpusAudio):
+    pass
+
+#Wraps a source that was opened ahead of time. fill() reads its first frames (blocking, so off the
+#event loop) so ffmpeg is already connected and producing audio by the time the handoff happens.
+class PrebufferedSource(dc.AudioSource):
+    def __init__(self, source):
+        self.source = source
+        self.frames = deque()
+        self.playing = False
+
+    def fill(self, count):
+        for _ in range(count):
+            frame = self.source.read()
+            if not frame:
+                break
+            self.frames.append(frame)
+        return len(self.frames)
+
+    def read(self):
+        if not self.playing:
+            self.playing = True
+            reset_meter = getattr(self.source, "reset_meter", None)
+            if reset_meter:
+                reset_meter()
+        if self.frames:
+            return self.frames.popleft()
+        return self.source.read()
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+def is_opus(codec):
+    return bool(codec) and codec.lower().startswith("opus")
+
+def open_audio_source(source, codec, before_options, label):
+    if OPUS_PASSTHROUGH and is_opus(codec):
+        #Already Opus, ffmpeg only has to remux it into Ogg pages.
+        audio_source = MeteredOpusAudio(source, codec='copy', before_options=before_options)
+        audio_source.init_meter(label, "opus passthrough")
+    else:
+        audio_source = MeteredPCMAudio(source, before_options=before_options)
+        audio_source.init_meter(label, "pcm")
+    return audio_source
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger('audiocache')
+
+#Leave DA_AUDIO_CACHE_DIR unset to turn the cache off.
+AUDIO_CACHE_DIR = os.getenv("DA_AUDIO_CACHE_DIR")
+AUDIO_CACHE_BYTES = int(os.getenv("DA_AUDIO_CACHE_BYTES", str(2 * 1024 ** 3)))
+#A track is cached once it has been played this many times.
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv("DA_AUDIO_CACHE_MIN_PLAYS", "2"))
+#Also download upcoming queue entries in the background as they get prefetched.
+AUDIO_CACHE_FILL_UPCOMING = os.getenv("DA_AUDIO_CACHE_FILL_UPCOMING", "0") == "1"
+AUDIO_CACHE_DOWNLOADS = int(os.getenv("DA_AUDIO_CACHE_DOWNLOADS", "2"))
+#How many tracks have their play counts remembered, least recently played forgotten first.
+AUDIO_CACHE_PLAY_HISTORY = int(os.getenv("DA_AUDIO_CACHE_PLAY_HISTORY", "10000"))
+
+#Opus-in-Ogg files keyed by video id, evicted least recently played first once over the byte budget.
+class AudioCache:
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_BYTES, min_plays=AUDIO_CACHE_MIN_PLAYS,
+                 fill_upcoming=AUDIO_CACHE_FILL_UPCOMING, downloads=AUDIO_CACHE_DOWNLOADS, play_history=AUDIO_CACHE_PLAY_HISTORY):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.fill_upcoming = fill_upcoming
+        self.entries = OrderedDict()  # video id -> size in bytes
+        self.total_bytes = 0
+        self.play_history = play_history
+        self.plays = OrderedDict()  # video id -> plays so far
+        self.downloading = {}
+        self.semaphore = asyncio.Semaphore(downloads)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.scan()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def path_for(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.ogg")
+
+    #Rebuild the LRU order from what's already on disk, oldest access first.
+    def scan(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".ogg"):
+                stat = entry.stat()
+                files.append((stat.st_atime, entry.name[:-len(".ogg")], stat.st_size))
+            elif entry.name.endswith(".part"):
+                os.unlink(entry.path)
+        for _, video_id, size in sorted(files):
+            self.entries[video_id] = size
+            self.total_bytes += size
+        self.evict()
+        logger.info(f"Audio cache holds {len(self.entries)} tracks ({self.total_bytes / 1024 ** 2:.0f} MiB)")
+
+    def get(self, video_id):
+        if not self.enabled or video_id not in self.entries:
+            return None
+        path = self.path_for(video_id)
+        if not os.path.exists(path):
+            self.total_bytes -= self.entries.pop(video_id)
+            return None
+        self.entries.move_to_end(video_id)
+        os.utime(path)
+        return path
+
+    #A file that can't be deleted (on Windows, one ffmpeg still has open) keeps its entry and is retried on the next eviction.
+    def evict(self):
+        for video_id in list(self.entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(self.path_for(video_id))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Couldn't evict {video_id} from the audio cache: {e}")
+                continue
+            self.total_bytes -= self.entries.pop(video_id)
+            logger.info(f"Evicted {video_id} from the audio cache")
+
+    #Counts a play and starts caching the track once it turns out to be a repeat.
+    def note_play(self, video_id, source_url, codec):
+        if not self.enabled or not video_id:
+            return
+        self.plays[video_id] = self.plays.pop(video_id, 0) + 1
+        while len(self.plays) > self.play_history:
+            self.plays.popitem(last=False)
+        if self.plays[video_id] >= self.min_plays:
+            self.fill(video_id, source_url, codec)
+
+    def fill(self, video_id, source_url, codec):
+        if not self.enabled or not video_id or not source_url:
+            return
+        if video_id in self.entries or video_id in self.downloading:
+            return
+        task = asyncio.create_task(self.download(video_id, source_url, codec))
+        self.downloading[video_id] = task
+        task.add_done_callback(lambda _: self.downloading.pop(video_id, None))
+
+    async def download(self, video_id, source_url, codec):
+        path = self.path_for(video_id)
+        part = path + ".part"
+        #Opus sources are just remuxed, anything else gets encoded once here instead of on every play.
+        encode = ['-c:a', 'copy'] if str(codec).startswith('opus') else ['-c:a', 'libopus', '-b:a', '128k']
+        process = None
+        async with self.semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', '-loglevel', 'error',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', source_url, '-vn', '-map', '0:a:0', *encode, '-f', 'ogg', '-y', part,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+                )
+                _, stderr = await process.communicate()
+                if process.returncode != 0:
+                    logger.warning(f"Couldn't cache {video_id}: {stderr.decode(errors='replace').strip()}")
+                    return
+                os.replace(part, path)
+            except asyncio.CancelledError:
+                if process is not None and process.returncode is None:
+                    process.kill()
+                raise
+            except OSError as e:
+                logger.warning(f"Couldn't cache {video_id}: {e}")
+                return
+            finally:
+                if os.path.exists(part):
+                    os.unlink(part)
+
+        size = os.path.getsize(path)
+        self.entries[video_id] = size
+        self.total_bytes += size
+        self.evict()
+        logger.info(f"Cached {video_id} ({size / 1024 ** 2:.1f} MiB)")
+
+    def stop(self):
+        for task in list(self.downloading.values()):
+            task.cancel()
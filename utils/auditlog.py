@@ -0,0 +1,119 @@
+import asyncio
+import os
+import time
+from collections import deque
+import discord as dc
+
+LOG_CHANNEL = "da-logs"
+#Pending entries are sent every interval, at most this many messages per interval across all guilds.
+AUDIT_FLUSH_INTERVAL = float(os.getenv("DA_AUDIT_FLUSH_INTERVAL", "3"))
+AUDIT_MESSAGES_PER_FLUSH = int(os.getenv("DA_AUDIT_MESSAGES_PER_FLUSH", "5"))
+AUDIT_MAX_PENDING = int(os.getenv("DA_AUDIT_MAX_PENDING", "500"))
+EMBED_LIMIT = 4000
+
+#Resolved log channel per guild (None when there isn't one), dropped whenever that guild's channels change.
+class ChannelCache:
+    def __init__(self, name=LOG_CHANNEL):
+        self.name = name
+        self.channels = {}
+
+    def get(self, guild: dc.Guild):
+        if guild.id not in self.channels:
+            channel = dc.utils.get(guild.text_channels, name=self.name)
+            self.channels[guild.id] = channel.id if channel else None
+        channel_id = self.channels[guild.id]
+        return guild.get_channel(channel_id) if channel_id else None
+
+    def invalidate(self, guild_id):
+        self.channels.pop(guild_id, None)
+
+#Collects audit entries from every cog and sends them to each guild's log channel as batched embeds.
+class AuditLogSink:
+    def __init__(self, bot, channels=None):
+        self.bot = bot
+        self.channels = channels or ChannelCache()
+        self.pending = {}
+        self.dropped = {}
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        await self.flush(limit=None)
+
+    def log(self, guild: dc.Guild, message: str):
+        entries = self.pending.setdefault(guild.id, deque())
+        if len(entries) >= AUDIT_MAX_PENDING:
+            entries.popleft()
+            self.dropped[guild.id] = self.dropped.get(guild.id, 0) + 1
+        entries.append((time.time(), message))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(AUDIT_FLUSH_INTERVAL)
+            try:
+                await self.flush(limit=AUDIT_MESSAGES_PER_FLUSH)
+            except Exception as e:
+                print(f"Couldn't flush audit log due to {e}")
+
+    #Oldest guild backlog goes first, whatever doesn't fit in this round waits for the next one.
+    async def flush(self, limit):
+        sent = 0
+        for guild_id in sorted(self.pending, key=lambda g: self.pending[g][0][0] if self.pending[g] else 0):
+            if limit is not None and sent >= limit:
+                break
+            entries = self.pending.get(guild_id)
+            if not entries:
+                self.pending.pop(guild_id, None)
+                continue
+
+            guild = self.bot.get_guild(guild_id)
+            channel = self.channels.get(guild) if guild else None
+            if channel is None:
+                #Nowhere to write to, don't let it pile up.
+                self.pending.pop(guild_id, None)
+                self.dropped.pop(guild_id, None)
+                continue
+
+            embed = self.build_embed(guild_id, entries)
+            try:
+                await channel.send(embed=embed)
+            except dc.NotFound:
+                self.channels.invalidate(guild_id)
+            except dc.HTTPException as e:
+                print(f"Couldn't write audit log for guild {guild_id} due to {e}")
+            sent += 1
+
+            if not entries:
+                self.pending.pop(guild_id, None)
+
+    #Discord caps a message at 6000 embed characters, so each message carries one embed of up to 4000.
+    def build_embed(self, guild_id, entries):
+        lines = []
+        size = 0
+        dropped = self.dropped.pop(guild_id, 0)
+        if dropped:
+            lines.append(f"*{dropped} older entries were dropped*")
+            size = len(lines[0]) + 1
+
+        while entries:
+            stamp, message = entries[0]
+            line = f"<t:{int(stamp)}:T> {message}"[:EMBED_LIMIT - 100]
+            if lines and size + len(line) + 1 > EMBED_LIMIT:
+                break
+            entries.popleft()
+            lines.append(line)
+            size += len(line) + 1
+
+        return dc.Embed(title="Audit log", description="\n".join(lines), color=dc.Color.dark_gray())
+
+#What the cogs call, a no-op when the log cog isn't loaded.
+def audit(bot, guild: dc.Guild, message: str):
+    logs = bot.get_cog("logcommands")
+    if logs and guild:
+        logs.sink.log(guild, message)
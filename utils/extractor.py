@@ -0,0 +1,186 @@
+import asyncio
+import os
+import re
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import yt_dlp as ytdl
+
+logger = logging.getLogger('extractor')
+
+YDL_OPTS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+    'default_search': 'ytsearch',
+}
+
+#Pool settings, overridable from the environment so each host can be tuned without code changes.
+EXTRACT_MODE = os.getenv("DA_EXTRACT_MODE", "thread")
+EXTRACT_WORKERS = int(os.getenv("DA_EXTRACT_WORKERS", "4"))
+EXTRACT_CONCURRENCY = int(os.getenv("DA_EXTRACT_CONCURRENCY", str(EXTRACT_WORKERS)))
+EXTRACT_TIMEOUT = float(os.getenv("DA_EXTRACT_TIMEOUT", "30"))
+#Extraction results are shared by every guild, a size of 0 turns the cache off.
+EXTRACT_CACHE_SIZE = int(os.getenv("DA_EXTRACT_CACHE_SIZE", "2048"))
+EXTRACT_CACHE_TTL = float(os.getenv("DA_EXTRACT_CACHE_TTL", "21600"))
+#Stream URLs this close to their expiry get resolved again instead of being handed to ffmpeg.
+STREAM_EXPIRY_MARGIN = 60
+
+EXPIRE_PATTERN = re.compile(r"[?&/]expire[=/](\d+)")
+VIDEO_ID_PATTERN = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/)([\w-]{11})")
+PLAYLIST_ID_PATTERN = re.compile(r"[?&]list=([\w-]+)")
+
+#Module level so it can be pickled into a process pool.
+def run_extract(query, opts):
+    with ytdl.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(query, download=False)
+        return ydl.sanitize_info(info)
+
+#Audio-only formats win over muxed ones, Opus over everything else (it can be passed straight
+#through to Discord), then the highest bitrate.
+def pick_audio_format(info):
+    formats = [f for f in info.get('formats', []) if f.get('acodec') not in (None, 'none') and f.get('url')]
+    if not formats:
+        return None
+    return max(formats, key=lambda f: (
+        f.get('vcodec') == 'none',
+        str(f.get('acodec')).startswith('opus'),
+        f.get('abr') or 0,
+    ))
+
+def pick_audio_url(info):
+    audio_format = pick_audio_format(info)
+    if audio_format:
+        return audio_format['url']
+    return None
+
+#googlevideo links carry their unix expiry either as a query param or a path segment.
+def stream_expiry(url):
+    match = EXPIRE_PATTERN.search(url or "")
+    if match:
+        return int(match.group(1))
+    return None
+
+def stream_expired(url, margin=STREAM_EXPIRY_MARGIN):
+    expiry = stream_expiry(url)
+    return expiry is not None and expiry - margin <= time.time()
+
+def video_id(url):
+    match = VIDEO_ID_PATTERN.search(url or "")
+    if match:
+        return match.group(1)
+    return None
+
+#Different spellings of the same video or search end up on the same cache entry.
+def cache_key(query: str, opts: dict):
+    flat = opts.get('extract_flat')
+    query = query.strip()
+    if query.startswith("ytsearch:"):
+        key = "search:" + " ".join(query[len("ytsearch:"):].lower().split())
+    else:
+        playlist = PLAYLIST_ID_PATTERN.search(query)
+        video = VIDEO_ID_PATTERN.search(query)
+        if playlist:
+            key = "playlist:" + playlist.group(1)
+        elif video:
+            key = "video:" + video.group(1)
+        else:
+            key = "url:" + query
+    return f"{key}|{flat}"
+
+class ExtractionCache:
+    def __init__(self, max_entries=EXTRACT_CACHE_SIZE, ttl=EXTRACT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires, info = entry
+        if expires <= time.time():
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return info
+
+    def put(self, key, info):
+        if self.max_entries <= 0:
+            return
+
+        #A result holding a stream URL must not outlive that URL.
+        expires = time.time() + self.ttl
+        stream_url = info.get('url') or pick_audio_url(info)
+        expiry = stream_expiry(stream_url)
+        if expiry is not None:
+            expires = min(expires, expiry - STREAM_EXPIRY_MARGIN)
+        if expires <= time.time():
+            return
+
+        self.entries[key] = (expires, info)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+class ExtractionPool:
+    def __init__(self, mode=EXTRACT_MODE, workers=EXTRACT_WORKERS, concurrency=EXTRACT_CONCURRENCY, timeout=EXTRACT_TIMEOUT):
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = ExtractionCache()
+        self.inflight = {}
+        if mode == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ytdl")
+        logger.info(f"Extraction pool started ({mode}, {workers} workers, {concurrency} concurrent, {timeout}s timeout)")
+
+    async def extract(self, query: str, opts: dict):
+        key = cache_key(query, opts)
+        info = self.cache.get(key)
+        if info is not None:
+            return info
+
+        #Concurrent requests for the same key share one extraction.
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.extract_and_cache(key, query, opts))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def extract_and_cache(self, key, query: str, opts: dict):
+        info = await self.run(query, opts)
+        self.cache.put(key, info)
+        return info
+
+    async def run(self, query: str, opts: dict):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, run_extract, query, opts)
+            try:
+                return await asyncio.wait_for(future, timeout=self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Extraction timed out after {self.timeout}s: {query}")
+                raise
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
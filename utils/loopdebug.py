@@ -0,0 +1,126 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+import logging
+from collections import Counter
+
+logger = logging.getLogger('loopdebug')
+
+#Milliseconds the loop may be held before it's reported, leave unset to keep the detector off at startup.
+BLOCKING_THRESHOLD = os.getenv("DA_BLOCKING_THRESHOLD")
+#Seconds between stall reports sent to Discord, stalls in between are only logged.
+BLOCKING_REPORT_INTERVAL = float(os.getenv("DA_BLOCKING_REPORT_INTERVAL", "30"))
+PROFILE_INTERVAL = float(os.getenv("DA_PROFILE_INTERVAL", "0.005"))
+
+#The event loop keeps bumping a heartbeat, a watchdog thread notices when it stops and grabs the loop
+#thread's stack while it's still stuck, which points at whatever callback is holding it.
+class BlockingDetector:
+    def __init__(self, threshold, on_block):
+        self.threshold = threshold  # seconds
+        self.interval = threshold / 4
+        self.on_block = on_block  # Called on the loop once a stall ends: (seconds, stack text)
+        self.beat = time.monotonic()
+        self.loop = None
+        self.loop_thread = None
+        self.heartbeat_task = None
+        self.watchdog = None
+        self.stopping = threading.Event()
+        self.stalls = 0
+
+    #Has to be called from the loop being watched.
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.stopping.clear()
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
+        self.watchdog = threading.Thread(target=self.watch, name="blocking-detector", daemon=True)
+        self.watchdog.start()
+        logger.info(f"Blocking-call detector on, threshold {self.threshold * 1000:.0f}ms")
+
+    def stop(self):
+        self.stopping.set()
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+
+    async def heartbeat(self):
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def watch(self):
+        stalled_since = None
+        stack = None
+        while not self.stopping.wait(self.interval):
+            beat = self.beat
+            if stalled_since is not None and beat != stalled_since:
+                #The loop is moving again, the stall lasted from the old beat to the new one.
+                duration = beat - stalled_since - self.interval
+                self.stalls += 1
+                self.loop.call_soon_threadsafe(self.on_block, duration, stack)
+                stalled_since = stack = None
+                continue
+
+            if stalled_since is None and time.monotonic() - beat > self.threshold + self.interval:
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is None:
+                    continue
+                stalled_since = beat
+                stack = "".join(traceback.format_stack(frame))
+                logger.warning(f"Event loop blocked for over {self.threshold * 1000:.0f}ms, currently in:\n{stack}")
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+#Samples the stacks of running threads for a fixed time. Blocking, so run it in an executor.
+class SamplingProfiler:
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id  # None samples every thread
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+
+    def run(self, seconds):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or (self.thread_id is not None and thread_id != self.thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        self.duration = time.perf_counter() - started
+        return self
+
+    #Top functions by samples spent in them (self) and anywhere below them on the stack (total).
+    def summary(self, top=15):
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+        sampled = sum(self.stacks.values()) or 1
+
+        lines = [f"{self.samples} samples over {self.duration:.1f}s ({self.interval * 1000:.0f}ms interval)", "", "Self time:"]
+        lines += [f"{count / sampled * 100:5.1f}%  {label}" for label, count in own.most_common(top)]
+        lines += ["", "Total time:"]
+        lines += [f"{count / sampled * 100:5.1f}%  {label}" for label, count in total.most_common(top)]
+        return "\n".join(lines)
+
+    #One "frame;frame;frame count" line per stack, what flamegraph.pl and speedscope read.
+    def collapsed(self):
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()) + "\n"
@@ -0,0 +1,236 @@
+import asyncio
+import functools
+import math
+import os
+import time
+import logging
+from bisect import bisect_left
+from discord import app_commands
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger('metrics')
+
+#Local Prometheus endpoint, off unless a port is set. Sharded workers add their first shard id to it
+#so every process on the host gets its own port.
+METRICS_HOST = os.getenv("DA_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("DA_METRICS_PORT")
+#How often the event loop is checked for lag, in seconds.
+LAG_INTERVAL = float(os.getenv("DA_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+#Fixed buckets like a Prometheus histogram, so recording is O(log buckets) and memory never grows.
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    #Upper bound of the bucket the quantile falls into, good enough to spot a slow command.
+    def quantile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * fraction)
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def cumulative(self):
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            yield str(bound), seen
+        yield "+Inf", self.count
+
+class CommandStats:
+    __slots__ = ("latency", "errors", "in_flight")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.in_flight = 0
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def label_string(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+class Metrics:
+    def __init__(self):
+        self.commands = {}
+        self.loop_lag = Histogram(LAG_BUCKETS)
+        self.last_lag = 0.0
+        self.gauges = {}  # name -> (help, callable returning a number)
+        self.started = time.time()
+        self.lag_task = None
+        self.server = None
+
+    def stats(self, name):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        return stats
+
+    def gauge(self, name, help, read):
+        self.gauges[name] = (help, read)
+
+    #Wraps the callback of every slash command in the tree, commands added later need another call.
+    def instrument(self, tree):
+        wrapped = 0
+        for command in tree.walk_commands():
+            if not isinstance(command, app_commands.Command) or getattr(command._callback, "metrics_wrapped", False):
+                continue
+            command._callback = self.wrap(command.qualified_name, command._callback)
+            wrapped += 1
+        logger.info(f"Instrumented {wrapped} slash commands")
+        return wrapped
+
+    def wrap(self, name, callback):
+        stats = self.stats(name)
+
+        @functools.wraps(callback)
+        async def timed(*args, **kwargs):
+            stats.in_flight += 1
+            started = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.in_flight -= 1
+                stats.latency.observe(time.perf_counter() - started)
+
+        timed.metrics_wrapped = True
+        return timed
+
+    async def start(self, port=None):
+        if self.lag_task is None or self.lag_task.done():
+            self.lag_task = asyncio.create_task(self.sample_lag())
+        if port is not None and self.server is None:
+            self.server = await asyncio.start_server(self.serve, METRICS_HOST, port)
+            logger.info(f"Serving Prometheus metrics on http://{METRICS_HOST}:{port}/metrics")
+
+    async def stop(self):
+        if self.lag_task:
+            self.lag_task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    #A sleep that wakes up late means something else held the loop for the difference.
+    async def sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.last_lag = max(0.0, loop.time() - started - LAG_INTERVAL)
+            self.loop_lag.observe(self.last_lag)
+
+    def read_gauges(self):
+        values = {}
+        for name, (help, read) in self.gauges.items():
+            try:
+                value = read()
+            except Exception as e:
+                logger.warning(f"Couldn't read gauge {name}: {e!r}")
+                continue
+            if value is not None:
+                values[name] = value
+        return values
+
+    #Prometheus text exposition format 0.0.4.
+    def render(self):
+        lines = []
+
+        def histogram(name, help, series):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                for bound, count in hist.cumulative():
+                    lines.append(f"{name}_bucket{label_string({**labels, 'le': bound})} {count}")
+                lines.append(f"{name}_sum{label_string(labels)} {hist.sum}")
+                lines.append(f"{name}_count{label_string(labels)} {hist.count}")
+
+        def per_command(name, kind, help, read):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for command, stats in sorted(self.commands.items()):
+                lines.append(f"{name}{label_string({'command': command})} {read(stats)}")
+
+        histogram("da_command_latency_seconds", "Slash command handler latency.",
+                  [({"command": command}, stats.latency) for command, stats in sorted(self.commands.items())])
+        per_command("da_command_errors_total", "counter", "Slash commands that raised.", lambda stats: stats.errors)
+        per_command("da_command_in_flight", "gauge", "Slash commands currently running.", lambda stats: stats.in_flight)
+        histogram("da_event_loop_lag_seconds", "How late the event loop woke up a sleeping task.", [({}, self.loop_lag)])
+
+        values = self.read_gauges()
+        for name, (help, read) in self.gauges.items():
+            if name in values:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {values[name]}")
+
+        lines.append("# HELP da_uptime_seconds Seconds since the metrics were set up.")
+        lines.append("# TYPE da_uptime_seconds gauge")
+        lines.append(f"da_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    #Just enough HTTP for a Prometheus scrape, anything but GET /metrics is a 404.
+    async def serve(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def metrics_port(bot):
+    if not METRICS_PORT:
+        return None
+    shard_ids = getattr(bot, "shard_ids", None)
+    return int(METRICS_PORT) + (min(shard_ids) if shard_ids else 0)
+
+#Current resident memory, None where it can't be read without psutil. getrusage() isn't a fallback,
+#its ru_maxrss is the peak and would hide memory being given back.
+def process_rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        #Linux: the second field is resident pages.
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
@@ -0,0 +1,59 @@
+import asyncio
+import ctypes.util
+import os
+import threading
+import logging
+import discord as dc
+
+logger = logging.getLogger('opusloader')
+
+BUNDLED_OPUS = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "libopus-0.dll"))
+
+#Result of the one probe this process makes, None until it has run. A failure is cached too, so a
+#missing library is looked for (find_library runs ldconfig/gcc) and logged once rather than on every connect.
+opus_loaded = None
+probe_lock = threading.Lock()
+
+def opus_candidates():
+    candidates = []
+    #An explicitly configured library always wins over whatever we find ourselves.
+    configured = os.getenv("DA_OPUS_LIB")
+    if configured:
+        candidates.append(configured)
+    system = ctypes.util.find_library("opus")
+    if system:
+        candidates.append(system)
+    if os.name == "nt" and os.path.exists(BUNDLED_OPUS):
+        candidates.append(BUNDLED_OPUS)
+    return candidates
+
+#Called on first voice use instead of at import, so shards that never touch voice don't pay for it
+#and a missing library can't break loading the whole commands extension.
+def ensure_opus():
+    global opus_loaded
+    with probe_lock:
+        if opus_loaded is None:
+            opus_loaded = load_opus()
+        return opus_loaded
+
+#Same, without blocking the event loop on the first probe.
+async def ensure_opus_async():
+    if opus_loaded is not None:
+        return opus_loaded
+    return await asyncio.to_thread(ensure_opus)
+
+def load_opus():
+    if dc.opus.is_loaded():
+        return True
+
+    for candidate in opus_candidates():
+        try:
+            dc.opus.load_opus(candidate)
+        except OSError as e:
+            logger.warning(f"Couldn't load Opus from {candidate}: {e}")
+            continue
+        logger.info(f"Opus library loaded successfully from {candidate}")
+        return True
+
+    logger.error("Failed to load Opus library, set DA_OPUS_LIB to its path. Only Opus passthrough streams will play.")
+    return False
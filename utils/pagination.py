@@ -0,0 +1,75 @@
+import math
+import discord as dc
+
+PAGE_SIZE = 10
+
+def shorten(text, limit):
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return text[:limit - 3] + "..."
+
+#Button driven pager. Only the visible page is ever rendered: count() gives the current
+#number of items and render_page(start, stop, page, pages) builds the embed for that slice.
+class Paginator(dc.ui.View):
+    def __init__(self, count, render_page, page_size=PAGE_SIZE, author_id=None, timeout=180):
+        super().__init__(timeout=timeout)
+        self.count = count
+        self.render_page = render_page
+        self.page_size = page_size
+        self.author_id = author_id
+        self.page = 0
+        self.message = None
+
+    def page_count(self):
+        return max(1, math.ceil(self.count() / self.page_size))
+
+    def render(self):
+        pages = self.page_count()
+        self.page = max(0, min(self.page, pages - 1))
+        self.first.disabled = self.previous.disabled = self.page == 0
+        self.next.disabled = self.last.disabled = self.page >= pages - 1
+
+        start = self.page * self.page_size
+        return self.render_page(start, start + self.page_size, self.page, pages)
+
+    async def send(self, interaction: dc.Interaction, **kwargs):
+        embed = self.render()
+        if self.page_count() <= 1:
+            await interaction.response.send_message(embed=embed, **kwargs)
+            return
+        await interaction.response.send_message(embed=embed, view=self, **kwargs)
+        self.message = await interaction.original_response()
+
+    async def interaction_check(self, interaction: dc.Interaction):
+        if self.author_id is not None and interaction.user.id != self.author_id:
+            await interaction.response.send_message("Only the person who ran the command can flip pages.", ephemeral=True)
+            return False
+        return True
+
+    async def flip(self, interaction: dc.Interaction, page):
+        self.page = page
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except dc.HTTPException:
+                pass
+
+    @dc.ui.button(label="«", style=dc.ButtonStyle.secondary)
+    async def first(self, interaction: dc.Interaction, button: dc.ui.Button):
+        await self.flip(interaction, 0)
+
+    @dc.ui.button(label="‹", style=dc.ButtonStyle.secondary)
+    async def previous(self, interaction: dc.Interaction, button: dc.ui.Button):
+        await self.flip(interaction, self.page - 1)
+
+    @dc.ui.button(label="›", style=dc.ButtonStyle.secondary)
+    async def next(self, interaction: dc.Interaction, button: dc.ui.Button):
+        await self.flip(interaction, self.page + 1)
+
+    @dc.ui.button(label="»", style=dc.ButtonStyle.secondary)
+    async def last(self, interaction: dc.Interaction, button: dc.ui.Button):
+        await self.flip(interaction, self.page_count() - 1)
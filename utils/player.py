@@ -0,0 +1,331 @@
+import asyncio
+import os
+import time
+import logging
+from utils.extractor import YDL_OPTS, pick_audio_format, stream_expired, video_id
+from utils.audio import open_audio_source, PrebufferedSource
+from utils.opusloader import ensure_opus_async
+from utils.trackqueue import TrackQueue
+
+logger = logging.getLogger('player')
+
+#Number of upcoming tracks whose stream URL is resolved in the background while the current one plays.
+PREFETCH_TRACKS = int(os.getenv("DA_PREFETCH_TRACKS", "2"))
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+#Seconds before leaving when nothing is playing, and when nobody but bots is left in the channel.
+IDLE_TIMEOUT = float(os.getenv("DA_IDLE_TIMEOUT", "120"))
+EMPTY_CHANNEL_TIMEOUT = float(os.getenv("DA_EMPTY_CHANNEL_TIMEOUT", "15"))
+#How long before the current track ends the next one's ffmpeg gets started, and how many 20ms frames it buffers.
+PRESPAWN_SECONDS = float(os.getenv("DA_PRESPAWN_SECONDS", "10"))
+PREBUFFER_FRAMES = int(os.getenv("DA_PREBUFFER_FRAMES", "50"))
+#Threads that read those first frames. Each fill waits on a fresh ffmpeg, so they get their own pool
+#rather than tying up the default executor that everything else in the process shares.
+PREBUFFER_WORKERS = int(os.getenv("DA_PREBUFFER_WORKERS", "4"))
+
+#Everything one guild needs to play music, so guilds never share a queue or a voice connection.
+class GuildPlayer:
+    def __init__(self, bot, guild_id, extractor, scheduler, audio_cache, prebuffer, on_idle):
+        self.bot = bot
+        self.guild_id = guild_id
+        self.extractor = extractor
+        self.prebuffer = prebuffer  # Executor for pre-spawn buffering, shared by every guild's player
+        self.audio_cache = audio_cache  # Shared on-disk Opus cache, may be disabled
+        self.scheduler = scheduler  # Shared by every guild's player
+        self.on_idle = on_idle  # Called once the player has disconnected so the cog can evict it
+        self.idle_call = None
+        self.idle_reason = None
+        self.voice_channel = None
+        self.voice_client = None
+        self.queue = TrackQueue()
+        self.current_track = None
+        self.is_moving = False  # Flag to indicate if the bot is moving voice channels
+        self.prepared = None  # (track, source) opened ahead of time for the next track
+        self.prespawn_call = None
+        self.track_ended = None
+        self.played = 0.0  # Seconds of the current track played before the last pause
+        self.resumed_at = None  # time.monotonic() when playback last started or resumed
+
+    def is_connected(self):
+        return self.voice_client is not None and self.voice_client.is_connected()
+
+    async def connect(self, channel):
+        await ensure_opus_async()
+        self.voice_channel = channel
+        try:
+            self.voice_client = await channel.connect()
+        except Exception:
+            # Don't keep an empty player around for a guild we never managed to join
+            if not self.queue and self.current_track is None:
+                self.on_idle(self)
+            raise
+        logger.info(f"[{self.guild_id}] Connected to voice channel: {channel.name}")
+        self.refresh_idle()
+
+    async def move_to(self, channel):
+        self.is_moving = True  # Indicate that the bot is moving
+        # Pause current playback if any
+        if self.voice_client.is_playing():
+            self.voice_client.pause()
+            logger.info(f"[{self.guild_id}] Paused current playback before moving.")
+        await self.voice_client.disconnect()
+        self.voice_client = None
+        logger.info(f"[{self.guild_id}] Disconnected from the previous voice channel.")
+        self.is_moving = False  # Reset the moving flag
+
+        await self.connect(channel)
+
+        # Resume playback if there was a track paused
+        if self.current_track and not self.voice_client.is_playing():
+            cached = self.audio_cache.get(video_id(self.current_track.url))
+            if not cached:
+                await self.resolve_track(self.current_track)
+            self.start(self.current_track, cached)
+            logger.info(f"[{self.guild_id}] Resumed playing: {self.current_track.title}")
+
+    async def disconnect(self):
+        self.disarm_idle()
+        self.drop_prepared()
+        if self.voice_client and self.voice_client.is_connected():
+            await self.voice_client.disconnect()
+        self.voice_client = None
+        self.current_track = None
+        self.on_idle(self)
+
+    #Reads the voice states rather than channel.members, which only lists members that are in the member cache.
+    def has_listeners(self):
+        channel = self.voice_client.channel
+        for user_id in channel.voice_states:
+            member = channel.guild.get_member(user_id)
+            if member is None:
+                if user_id != self.bot.user.id:
+                    return True
+            elif not member.bot:
+                return True
+        return False
+
+    def is_active(self):
+        if self.voice_client.is_playing():
+            return True
+        # A track that is still resolving counts as playing, a paused one doesn't
+        return self.current_track is not None and not self.voice_client.is_paused()
+
+    #Re-evaluated whenever playback starts, stops or pauses and whenever someone joins or leaves our channel.
+    def refresh_idle(self):
+        if not self.is_connected():
+            return
+        if not self.has_listeners():
+            self.arm_idle(EMPTY_CHANNEL_TIMEOUT, "empty channel")
+        elif self.is_active():
+            self.disarm_idle()
+        else:
+            self.arm_idle(IDLE_TIMEOUT, "nothing playing")
+
+    def arm_idle(self, delay, reason):
+        if self.idle_call is not None and self.idle_reason == reason:
+            return
+        self.disarm_idle()
+        self.idle_reason = reason
+        self.idle_call = self.scheduler.call_later(delay, self.idle_timeout)
+
+    def disarm_idle(self):
+        if self.idle_call is not None:
+            self.scheduler.cancel(self.idle_call)
+        self.idle_call = None
+        self.idle_reason = None
+
+    async def idle_timeout(self):
+        reason = self.idle_reason
+        self.idle_call = None
+        self.idle_reason = None
+        if self.is_connected():
+            logger.info(f"[{self.guild_id}] Disconnected due to inactivity ({reason}).")
+            await self.disconnect()
+
+    def open_source(self, track, cached=None):
+        if cached:
+            return open_audio_source(cached, 'opus', None, self.guild_id)
+        return open_audio_source(track.source_url, track.codec, FFMPEG_BEFORE_OPTIONS, self.guild_id)
+
+    def start(self, track, cached=None, audio_source=None):
+        if audio_source is None:
+            audio_source = self.open_source(track, cached)
+        self.voice_client.play(audio_source, after=self.after_play)
+        if self.track_ended is not None:
+            logger.info(f"[{self.guild_id}] Gap between tracks: {(time.perf_counter() - self.track_ended) * 1000:.0f}ms")
+            self.track_ended = None
+        self.audio_cache.note_play(video_id(track.url), track.source_url, track.codec)
+        self.played = 0.0
+        self.resumed_at = time.monotonic()
+        self.refresh_idle()
+        self.schedule_prespawn(track.duration)
+
+    #Runs on discord.py's audio thread, so it only hands the transition to the event loop and returns.
+    def after_play(self, error):
+        self.track_ended = time.perf_counter()
+        if error:
+            logger.error(f"[{self.guild_id}] Player error: {error}")
+
+        # Only proceed if not moving to another voice channel
+        if not self.is_moving:
+            future = asyncio.run_coroutine_threadsafe(self.play_next(), self.bot.loop)
+            future.add_done_callback(self.after_transition)
+
+    def after_transition(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"[{self.guild_id}] Error in after_play coroutine: {future.exception()!r}")
+
+    def schedule_prespawn(self, remaining):
+        if self.prespawn_call is not None:
+            self.scheduler.cancel(self.prespawn_call)
+            self.prespawn_call = None
+        if remaining:
+            self.prespawn_call = self.scheduler.call_later(max(0, remaining - PRESPAWN_SECONDS), self.prespawn_next)
+
+    #A paused track doesn't get closer to its end, so the pre-spawn deadline (and any source it
+    #already opened) is dropped on pause and worked out again from what's left on resume.
+    def pause(self):
+        self.voice_client.pause()
+        if self.resumed_at is not None:
+            self.played += time.monotonic() - self.resumed_at
+            self.resumed_at = None
+        self.drop_prepared()
+        self.refresh_idle()
+
+    def resume(self):
+        self.voice_client.resume()
+        self.resumed_at = time.monotonic()
+        if self.current_track is not None and self.current_track.duration:
+            self.schedule_prespawn(max(0, self.current_track.duration - self.played))
+        self.refresh_idle()
+
+    #Opens the next track's source shortly before the current one ends and buffers its first frames.
+    async def prespawn_next(self):
+        self.prespawn_call = None
+        upcoming = self.queue.peek(1)
+        if not upcoming or not self.is_connected():
+            return
+        track = upcoming[0]
+        if self.prepared is not None and self.prepared[0] is track:
+            return
+        self.drop_prepared()
+
+        cached = self.audio_cache.get(video_id(track.url))
+        try:
+            if not cached:
+                await self.resolve_track(track)
+            audio_source = PrebufferedSource(self.open_source(track, cached))
+            frames = await asyncio.get_running_loop().run_in_executor(self.prebuffer, audio_source.fill, PREBUFFER_FRAMES)
+        except Exception as e:
+            logger.warning(f"[{self.guild_id}] Couldn't pre-spawn {track.title}: {e!r}")
+            return
+
+        #The queue may have moved on while we were buffering.
+        upcoming = self.queue.peek(1)
+        if not upcoming or upcoming[0] is not track or not self.is_connected():
+            audio_source.cleanup()
+            return
+        self.prepared = (track, audio_source)
+        logger.info(f"[{self.guild_id}] Pre-spawned {track.title} with {frames} frames buffered")
+
+    def drop_prepared(self):
+        if self.prespawn_call is not None:
+            self.scheduler.cancel(self.prespawn_call)
+            self.prespawn_call = None
+        if self.prepared is not None:
+            self.prepared[1].cleanup()
+            self.prepared = None
+
+    def take_prepared(self, track):
+        prepared = self.prepared
+        self.prepared = None
+        if prepared is None:
+            return None
+        if prepared[0] is track:
+            return prepared[1]
+        prepared[1].cleanup()
+        return None
+
+    async def play_next(self):
+        while True:
+            if not self.queue or not self.is_connected():
+                self.current_track = None
+                self.track_ended = None
+                logger.info(f"[{self.guild_id}] No more tracks in the queue or voice client disconnected.")
+                self.refresh_idle()
+                return
+
+            track = self.queue.pop_front()
+            self.current_track = track
+
+            audio_source = self.take_prepared(track)
+            if audio_source is not None:
+                cached = None
+                break
+
+            # The stream URL is only fetched right before playback so it can't go stale in the queue
+            cached = self.audio_cache.get(video_id(track.url))
+            if cached:
+                break
+            try:
+                await self.resolve_track(track)
+                break
+            except Exception as e:
+                logger.error(f"[{self.guild_id}] Couldn't resolve {track.title}, skipping it: {e!r}")
+
+        if not self.is_connected():
+            self.current_track = None
+            if audio_source is not None:
+                audio_source.cleanup()
+            return
+
+        self.start(track, cached, audio_source)
+        logger.info(f"[{self.guild_id}] Now playing: {track.title}{' (cached)' if cached else ''}{' (pre-spawned)' if audio_source else ''}")
+        self.prefetch_upcoming()
+
+    async def resolve_track(self, track):
+        if track.prefetch is not None:
+            await track.prefetch
+            track.prefetch = None
+
+        if track.source_url and not stream_expired(track.source_url):
+            return
+
+        await self.fetch_stream(track)
+
+    async def fetch_stream(self, track):
+        info = await self.extractor.extract(track.url, YDL_OPTS)
+        audio_format = pick_audio_format(info)
+        if not audio_format:
+            raise ValueError("No suitable audio format")
+        track.set_format(audio_format)
+        if not track.duration:
+            track.duration = info.get('duration')
+
+    async def prefetch_track(self, track):
+        try:
+            await self.fetch_stream(track)
+            if self.audio_cache.fill_upcoming:
+                self.audio_cache.fill(video_id(track.url), track.source_url, track.codec)
+        except Exception as e:
+            # play_next will try again once the track comes up
+            logger.warning(f"[{self.guild_id}] Prefetch failed for {track.title}: {e!r}")
+
+    def prefetch_upcoming(self):
+        for track in self.queue.peek(PREFETCH_TRACKS):
+            if track.prefetch is None and not track.source_url and not self.audio_cache.get(video_id(track.url)):
+                track.prefetch = asyncio.create_task(self.prefetch_track(track))
+
+    async def enqueue(self, tracks):
+        self.queue.extend(tracks)
+        if self.current_track is None and not self.voice_client.is_playing():
+            await self.play_next()
+        else:
+            self.prefetch_upcoming()
+
+    def clear(self):
+        self.queue.clear()
+        self.drop_prepared()
+        if self.voice_client and self.voice_client.is_playing():
+            self.voice_client.stop()
+        self.current_track = None
+        self.refresh_idle()
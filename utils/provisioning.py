@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import discord as dc
+
+STATE_DB = os.getenv("DA_STATE_DB", "bot_state.db")
+#How many guilds are set up at once, so a burst of joins doesn't eat the whole rate limit.
+PROVISION_CONCURRENCY = int(os.getenv("DA_PROVISION_CONCURRENCY", "4"))
+PROVISION_ATTEMPTS = 4
+
+DEBUG_ROLE = "DA Debug"
+DJ_ROLE = "Devil's DJ"
+DEBUG_CHANNEL = "devils-advocate-debug-channel"
+LOG_CHANNEL = "da-logs"
+
+#Remembers how far each guild got, so partially provisioned guilds can be finished on the next start.
+class ProvisioningStore:
+    def __init__(self, path=STATE_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS provisioning (
+                    guild_id INTEGER PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    missing TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+
+    def get(self, guild_id):
+        row = self.conn.execute("SELECT state, missing FROM provisioning WHERE guild_id = ?", (guild_id,)).fetchone()
+        if row is None:
+            return None, []
+        return row[0], json.loads(row[1])
+
+    def set(self, guild_id, state, missing=()):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO provisioning (guild_id, state, missing, updated) VALUES (?, ?, ?, ?)",
+                (guild_id, state, json.dumps(list(missing)), time.time())
+            )
+
+    #Runs that were cut short or hit transient errors. "denied" guilds are left alone until the bot joins
+    #them again, retrying a 403 on every reconnect only counts towards Discord's invalid request limit.
+    def partial(self):
+        return [row[0] for row in self.conn.execute("SELECT guild_id FROM provisioning WHERE state IN ('pending', 'partial')")]
+
+    def close(self):
+        self.conn.close()
+
+def retryable(error):
+    return isinstance(error, dc.HTTPException) and (error.status == 429 or error.status >= 500)
+
+#Retries rate limits and Discord-side errors with exponential backoff, anything else (e.g. missing permissions) fails right away.
+async def with_backoff(create):
+    delay = 1
+    for attempt in range(PROVISION_ATTEMPTS):
+        try:
+            return await create()
+        except dc.HTTPException as e:
+            if not retryable(e) or attempt == PROVISION_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(getattr(e, "retry_after", None) or delay)
+            delay *= 2
+
+class GuildProvisioner:
+    def __init__(self, store):
+        self.store = store
+        self.semaphore = asyncio.Semaphore(PROVISION_CONCURRENCY)
+        self.running = {}
+
+    #Joining twice while the first run is still going shares that run instead of racing it.
+    async def provision(self, guild: dc.Guild):
+        task = self.running.get(guild.id)
+        if task is None:
+            task = asyncio.create_task(self.run(guild))
+            self.running[guild.id] = task
+            task.add_done_callback(lambda _: self.running.pop(guild.id, None))
+        return await task
+
+    async def run(self, guild: dc.Guild):
+        async with self.semaphore:
+            started = time.perf_counter()
+            self.store.set(guild.id, "pending")
+            failed = []
+            denied = []  # Failures that won't go away by retrying, e.g. missing Manage Roles
+
+            async def ensure_role(name, create):
+                role = dc.utils.get(guild.roles, name=name)
+                if role is not None:
+                    return role
+                try:
+                    role = await with_backoff(create)
+                    print(f"[{guild.id}] Role created: {role.name}")
+                    return role
+                except Exception as e:
+                    (denied if isinstance(e, dc.HTTPException) and not retryable(e) else failed).append(name)
+                    print(f"[{guild.id}] Failed to create role {name} due to: {e}")
+                    return None
+
+            async def ensure_channel(name, create):
+                if dc.utils.get(guild.text_channels, name=name) is not None:
+                    return
+                try:
+                    channel = await with_backoff(create)
+                    print(f"[{guild.id}] Channel created: {channel.name}")
+                except Exception as e:
+                    (denied if isinstance(e, dc.HTTPException) and not retryable(e) else failed).append(name)
+                    print(f"[{guild.id}] Couldn't create channel {name} due to: {e}")
+
+            #Roles first since the channel overwrites need the debug role, each step's creations run concurrently.
+            debug_role, _ = await asyncio.gather(
+                ensure_role(DEBUG_ROLE, lambda: guild.create_role(
+                    name=DEBUG_ROLE,
+                    color=dc.Color.dark_gray(),
+                    permissions=dc.Permissions(permissions=5),
+                    reason="Auto-created by bot for debugging purposes"
+                )),
+                ensure_role(DJ_ROLE, lambda: guild.create_role(
+                    name=DJ_ROLE,
+                    color=dc.Color.red(),
+                    permissions=dc.Permissions(permissions=5),
+                    reason="Auto-created to allow music operation."
+                )),
+            )
+
+            overwrites = {
+                guild.default_role: dc.PermissionOverwrite(read_messages=False),
+                guild.me: dc.PermissionOverwrite(read_messages=True),
+            }
+            if debug_role:
+                overwrites[debug_role] = dc.PermissionOverwrite(read_messages=True)
+
+            await asyncio.gather(
+                ensure_channel(DEBUG_CHANNEL, lambda: guild.create_text_channel(
+                    name=DEBUG_CHANNEL,
+                    overwrites=overwrites,
+                    reason="Auto-created by bot for debugging purposes"
+                )),
+                ensure_channel(LOG_CHANNEL, lambda: guild.create_text_channel(
+                    name=LOG_CHANNEL,
+                    overwrites=overwrites,
+                    reason="Auto-created by bot for logging purposes"
+                )),
+            )
+
+            missing = failed + denied
+            state = "partial" if failed else "denied" if denied else "done"
+            self.store.set(guild.id, state, missing)
+            print(f"[{guild.id}] Provisioned in {(time.perf_counter() - started) * 1000:.0f}ms" + (f", missing: {', '.join(missing)} ({state})" if missing else ""))
+            return not missing
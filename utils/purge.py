@@ -0,0 +1,117 @@
+import asyncio
+import time
+from datetime import timedelta
+import discord as dc
+
+#Bulk delete only accepts messages younger than 14 days, keep a little slack for clock drift.
+BULK_DELETE_AGE = timedelta(days=14) - timedelta(minutes=5)
+BULK_DELETE_SIZE = 100
+PROGRESS_INTERVAL = 5
+
+def build_check(user=None, contains=None, bots=False):
+    contains = contains.lower() if contains else None
+
+    def check(message):
+        if user is not None and message.author.id != user.id:
+            return False
+        if bots and not message.author.bot:
+            return False
+        if contains and contains not in message.content.lower():
+            return False
+        return True
+    return check
+
+#Walks the channel history newest first. Recent matches are bulk deleted 100 at a time, anything
+#older than 14 days has to go one by one. discord.py's HTTP client waits out the rate limits for us.
+class PurgeJob:
+    def __init__(self, channel, limit, check=None, on_progress=None):
+        self.channel = channel
+        self.limit = limit
+        self.check = check
+        self.on_progress = on_progress
+        self.scanned = 0
+        self.deleted = 0
+        self.failed = 0
+        self.cancelled = False
+        self.done = False
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.cancelled = True
+            self.task.cancel()
+
+    async def run(self):
+        cutoff = dc.utils.utcnow() - BULK_DELETE_AGE
+        batch = []
+        try:
+            async for message in self.channel.history(limit=self.limit):
+                self.scanned += 1
+                if self.check is not None and not self.check(message):
+                    continue
+
+                if message.created_at > cutoff:
+                    batch.append(message)
+                    if len(batch) >= BULK_DELETE_SIZE:
+                        await self.delete_batch(batch)
+                        batch = []
+                else:
+                    if batch:
+                        await self.delete_batch(batch)
+                        batch = []
+                    await self.delete_single(message)
+
+                await self.report()
+
+            if batch:
+                await self.delete_batch(batch)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.done = True
+            await self.report(force=True)
+        return self.deleted
+
+    async def delete_batch(self, messages):
+        if len(messages) == 1:
+            await self.delete_single(messages[0])
+            return
+        try:
+            await self.channel.delete_messages(messages)
+            self.deleted += len(messages)
+        except dc.HTTPException as e:
+            print(f"Bulk delete of {len(messages)} messages in #{self.channel} failed due to {e}")
+            self.failed += len(messages)
+
+    async def delete_single(self, message):
+        try:
+            await message.delete()
+            self.deleted += 1
+        except dc.NotFound:
+            pass
+        except dc.HTTPException as e:
+            print(f"Couldn't delete message {message.id} in #{self.channel} due to {e}")
+            self.failed += 1
+
+    async def report(self, force=False):
+        now = time.monotonic()
+        if self.on_progress is None or (not force and now - self.last_report < PROGRESS_INTERVAL):
+            return
+        self.last_report = now
+        try:
+            await self.on_progress(self)
+        except Exception as e:
+            print(f"Couldn't report purge progress due to {e}")
+
+    def summary(self):
+        state = "Cancelled" if self.cancelled else "Finished" if self.done else "Purging"
+        text = f"{state}: deleted {self.deleted} of {self.scanned} scanned messages in {time.monotonic() - self.started:.0f}s"
+        if self.failed:
+            text += f" ({self.failed} couldn't be deleted)"
+        return text
@@ -0,0 +1,135 @@
+import random
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from utils.quotestore import QUOTE_CACHE_GUILDS
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    return set(WORD_PATTERN.findall(str(text).lower()))
+
+#Inverted index over one guild's quotes. Documents get a private id in insertion order,
+#so lookups never depend on list positions that shift when a quote is removed.
+class QuoteIndex:
+    def __init__(self, quotes=()):
+        self.next_id = 0
+        self.docs = {}
+        self.words = {}
+        self.authors = {}
+        self.messages = {}
+        self.dates = []  # sorted (message_date, doc_id)
+        self.ids = []  # live doc ids, for O(1) random picks
+        self.positions = {}
+        for quote in quotes:
+            self.add(quote)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, quote):
+        doc_id = self.next_id
+        self.next_id += 1
+        self.docs[doc_id] = quote
+        for word in tokenize(quote.get("content", "")):
+            self.words.setdefault(word, set()).add(doc_id)
+        self.authors.setdefault(str(quote.get("author", "")).lower(), set()).add(doc_id)
+        self.messages.setdefault(quote.get("message_id"), set()).add(doc_id)
+        insort(self.dates, (quote.get("message_date", ""), doc_id))
+        self.positions[doc_id] = len(self.ids)
+        self.ids.append(doc_id)
+
+    def remove(self, quote):
+        candidates = self.messages.get(quote.get("message_id"), set())
+        doc_id = next((d for d in sorted(candidates) if self.docs[d] == quote), None)
+        if doc_id is None:
+            return False
+
+        del self.docs[doc_id]
+        for word in tokenize(quote.get("content", "")):
+            self.discard(self.words, word, doc_id)
+        self.discard(self.authors, str(quote.get("author", "")).lower(), doc_id)
+        self.discard(self.messages, quote.get("message_id"), doc_id)
+
+        entry = (quote.get("message_date", ""), doc_id)
+        i = bisect_left(self.dates, entry)
+        if i < len(self.dates) and self.dates[i] == entry:
+            del self.dates[i]
+
+        #Swap the last id into the hole so the random pick list stays dense.
+        position = self.positions.pop(doc_id)
+        last = self.ids.pop()
+        if last != doc_id:
+            self.ids[position] = last
+            self.positions[last] = position
+        return True
+
+    def discard(self, postings, key, doc_id):
+        docs = postings.get(key)
+        if docs is not None:
+            docs.discard(doc_id)
+            if not docs:
+                del postings[key]
+
+    #Words are ANDed together. after/before are ISO date strings, before is inclusive of that whole day.
+    def search(self, words="", author=None, after=None, before=None):
+        sets = []
+        for word in sorted(tokenize(words or "")):
+            docs = self.words.get(word)
+            if not docs:
+                return []
+            sets.append(docs)
+
+        if author:
+            docs = self.authors.get(author.lower())
+            if not docs:
+                return []
+            sets.append(docs)
+
+        if after or before:
+            start = bisect_left(self.dates, (after,)) if after else 0
+            stop = bisect_right(self.dates, (before + "\uffff",)) if before else len(self.dates)
+            sets.append({doc_id for _, doc_id in self.dates[start:stop]})
+
+        if not sets:
+            matches = self.docs.keys()
+        else:
+            sets.sort(key=len)
+            matches = set(sets[0]).intersection(*sets[1:])
+        return [self.docs[doc_id] for doc_id in sorted(matches)]
+
+    def random(self):
+        if not self.ids:
+            return None
+        return self.docs[random.choice(self.ids)]
+
+#Per-guild indexes, built from the quote store the first time a guild is searched
+#and kept up to date by the quote commands afterwards. Only the most recently searched
+#`max_guilds` are kept, an evicted guild is rebuilt from the store on its next search.
+class QuoteSearch:
+    def __init__(self, store, max_guilds=QUOTE_CACHE_GUILDS):
+        self.store = store
+        self.max_guilds = max_guilds
+        self.indexes = OrderedDict()
+
+    def index(self, guild_id):
+        index = self.indexes.get(guild_id)
+        if index is not None:
+            self.indexes.move_to_end(guild_id)
+            return index
+        index = QuoteIndex(self.store.all(guild_id))
+        self.indexes[guild_id] = index
+        while len(self.indexes) > self.max_guilds:
+            self.indexes.popitem(last=False)
+        return index
+
+    def added(self, guild_id, quote):
+        index = self.indexes.get(guild_id)
+        if index is not None:
+            index.add(quote)
+
+    def removed(self, guild_id, quote):
+        index = self.indexes.get(guild_id)
+        if index is not None and not index.remove(quote):
+            #Out of sync somehow, rebuild on the next query.
+            del self.indexes[guild_id]
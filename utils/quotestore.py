@@ -0,0 +1,372 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUOTE_DIR = "server_quotes"
+QUOTE_DB = os.path.join(QUOTE_DIR, "quotes.db")
+#"sqlite" (default) or "json" for the old one-file-per-guild layout.
+QUOTE_BACKEND = os.getenv("DA_QUOTE_BACKEND", "sqlite")
+#JSON backend write-back cache: how many guild books stay in memory and how often dirty ones hit disk.
+QUOTE_CACHE_GUILDS = int(os.getenv("DA_QUOTE_CACHE_GUILDS", "256"))
+QUOTE_FLUSH_INTERVAL = float(os.getenv("DA_QUOTE_FLUSH_INTERVAL", "5"))
+
+#Every backend hands quotes around as the same dicts save_quote has always written:
+#{"content", "author", "message_id", "message_date"}. Indexes are 0-based insertion order.
+class QuoteStore(ABC):
+    #Seconds between flush_async() calls, None when every write is already durable.
+    flush_interval = None
+
+    def ensure_guild(self, guild_id):
+        pass
+
+    def flush(self):
+        pass
+
+    async def flush_async(self):
+        return self.flush()
+
+    @abstractmethod
+    def add(self, guild_id, quote):
+        pass
+
+    def add_many(self, guild_id, quotes):
+        for quote in quotes:
+            self.add(guild_id, quote)
+
+    @abstractmethod
+    def count(self, guild_id):
+        pass
+
+    @abstractmethod
+    def page(self, guild_id, offset, limit):
+        pass
+
+    def all(self, guild_id):
+        return self.page(guild_id, 0, self.count(guild_id))
+
+    @abstractmethod
+    def remove_at(self, guild_id, index):
+        pass
+
+    def close(self):
+        pass
+
+class JsonQuoteStore(QuoteStore):
+    def __init__(self, quote_dir=QUOTE_DIR):
+        self.quote_dir = quote_dir
+        os.makedirs(quote_dir, exist_ok=True)
+
+    def get_server_file(self, guild_id):
+        return os.path.join(self.quote_dir, f"{guild_id}.json")
+
+    def load_quotes(self, guild_id):
+        file_path = self.get_server_file(guild_id)
+        if os.path.exists(file_path):
+            with open(file_path, "r") as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    print(f"Invalid JSON in {file_path}. Resetting quotes.")
+                    return []
+        else:
+            return []
+
+    #Written to a temp file and renamed over the old one, so a crash never leaves half a file behind.
+    def save_quotes(self, guild_id, quotes):
+        file_path = self.get_server_file(guild_id)
+        fd, temp_path = tempfile.mkstemp(dir=self.quote_dir, prefix=f".{guild_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(quotes, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, file_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def ensure_guild(self, guild_id):
+        if not os.path.exists(self.get_server_file(guild_id)):
+            self.save_quotes(guild_id, [])
+
+    def add(self, guild_id, quote):
+        quotes = self.load_quotes(guild_id)
+        quotes.append(quote)
+        self.save_quotes(guild_id, quotes)
+
+    def count(self, guild_id):
+        return len(self.load_quotes(guild_id))
+
+    def page(self, guild_id, offset, limit):
+        return self.load_quotes(guild_id)[offset:offset + limit]
+
+    def all(self, guild_id):
+        return self.load_quotes(guild_id)
+
+    def remove_at(self, guild_id, index):
+        quotes = self.load_quotes(guild_id)
+        if not 0 <= index < len(quotes):
+            return None
+        removed = quotes.pop(index)
+        self.save_quotes(guild_id, quotes)
+        return removed
+
+#Keeps recently used guild books in memory and writes changed ones back in batches,
+#so reads never touch disk and a burst of saves costs a single write.
+class CachedJsonQuoteStore(JsonQuoteStore):
+    def __init__(self, quote_dir=QUOTE_DIR, max_guilds=QUOTE_CACHE_GUILDS, flush_interval=QUOTE_FLUSH_INTERVAL):
+        super().__init__(quote_dir)
+        self.max_guilds = max_guilds
+        self.flush_interval = flush_interval
+        self.books = OrderedDict()
+        self.dirty = set()
+        self.evicted = {}  # guild id -> dirty book pushed out of the cache, written on the next flush
+        #One writer thread, so two flushes never race each other to the same file.
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quote-flush")
+
+    def book(self, guild_id):
+        quotes = self.books.get(guild_id)
+        if quotes is not None:
+            self.books.move_to_end(guild_id)
+            return quotes
+
+        quotes = self.evicted.pop(guild_id, None)
+        if quotes is not None:
+            self.dirty.add(guild_id)
+        else:
+            quotes = self.load_quotes(guild_id)
+        self.books[guild_id] = quotes
+        while len(self.books) > self.max_guilds:
+            evicted_id, evicted = self.books.popitem(last=False)
+            if evicted_id in self.dirty:
+                self.evicted[evicted_id] = evicted
+                self.dirty.discard(evicted_id)
+        return quotes
+
+    def ensure_guild(self, guild_id):
+        if guild_id not in self.books and guild_id not in self.evicted:
+            super().ensure_guild(guild_id)
+
+    def add(self, guild_id, quote):
+        self.book(guild_id).append(quote)
+        self.dirty.add(guild_id)
+
+    def add_many(self, guild_id, quotes):
+        self.book(guild_id).extend(quotes)
+        self.dirty.add(guild_id)
+
+    def count(self, guild_id):
+        return len(self.book(guild_id))
+
+    def page(self, guild_id, offset, limit):
+        return self.book(guild_id)[offset:offset + limit]
+
+    def all(self, guild_id):
+        return list(self.book(guild_id))
+
+    def remove_at(self, guild_id, index):
+        quotes = self.book(guild_id)
+        if not 0 <= index < len(quotes):
+            return None
+        removed = quotes.pop(index)
+        self.dirty.add(guild_id)
+        return removed
+
+    #Copies of every changed book, taken on the loop so the writer never sees a list mid-update.
+    def take_dirty(self):
+        snapshot = [(guild_id, list(self.books[guild_id])) for guild_id in self.dirty if guild_id in self.books]
+        snapshot += self.evicted.items()
+        self.dirty.clear()
+        self.evicted = {}
+        return snapshot
+
+    def write_books(self, snapshot):
+        failed = []
+        for guild_id, quotes in snapshot:
+            try:
+                self.save_quotes(guild_id, quotes)
+            except OSError as e:
+                print(f"Couldn't flush quotes for guild {guild_id} due to: {e}")
+                failed.append((guild_id, quotes))
+        return failed
+
+    #Books that failed to write go back in the queue unless they were changed again in the meantime.
+    def requeue(self, failed):
+        for guild_id, quotes in failed:
+            if guild_id in self.books:
+                self.dirty.add(guild_id)
+            else:
+                self.evicted.setdefault(guild_id, quotes)
+
+    async def flush_async(self):
+        snapshot = self.take_dirty()
+        if not snapshot:
+            return 0
+        failed = await asyncio.wrap_future(self.writer.submit(self.write_books, snapshot))
+        self.requeue(failed)
+        return len(snapshot) - len(failed)
+
+    #Blocking, only for shutdown once the loop no longer matters. Queued behind a flush that's still writing.
+    def flush(self):
+        snapshot = self.take_dirty()
+        failed = self.writer.submit(self.write_books, snapshot).result()
+        self.requeue(failed)
+        return len(snapshot) - len(failed)
+
+    def close(self):
+        self.flush()
+        self.writer.shutdown()
+
+#Positions are turned into row ids through a per-guild list of ids (8 bytes a quote, the most recently
+#used QUOTE_CACHE_GUILDS guilds kept), so paging and removal seek straight to a row through the
+#(guild_id, id) index instead of having SQLite step over `offset` rows.
+class SqliteQuoteStore(QuoteStore):
+    def __init__(self, path=QUOTE_DB, max_guilds=QUOTE_CACHE_GUILDS):
+        self.max_guilds = max_guilds
+        self.ids = OrderedDict()  # guild id -> array of quote ids in insertion order
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        #WAL keeps readers off the writer's back and survives a crash mid-write.
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS quotes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    guild_id INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    author TEXT NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    message_date TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_quotes_guild ON quotes (guild_id, id);
+                CREATE INDEX IF NOT EXISTS idx_quotes_author ON quotes (guild_id, author);
+                CREATE INDEX IF NOT EXISTS idx_quotes_message ON quotes (message_id);
+            """)
+
+    def row_to_quote(self, row):
+        return {
+            "content": row["content"],
+            "author": row["author"],
+            "message_id": row["message_id"],
+            "message_date": row["message_date"],
+        }
+
+    def guild_ids(self, guild_id):
+        ids = self.ids.get(guild_id)
+        if ids is None:
+            ids = array("q", (row[0] for row in self.conn.execute(
+                "SELECT id FROM quotes WHERE guild_id = ? ORDER BY id", (guild_id,)
+            )))
+            self.ids[guild_id] = ids
+            while len(self.ids) > self.max_guilds:
+                self.ids.popitem(last=False)
+        self.ids.move_to_end(guild_id)
+        return ids
+
+    def add(self, guild_id, quote):
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO quotes (guild_id, content, author, message_id, message_date) VALUES (?, ?, ?, ?, ?)",
+                (guild_id, quote["content"], quote["author"], quote["message_id"], quote["message_date"])
+            )
+        #Ids only grow, so a new quote always belongs at the end.
+        if guild_id in self.ids:
+            self.ids[guild_id].append(cursor.lastrowid)
+
+    def add_many(self, guild_id, quotes):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO quotes (guild_id, content, author, message_id, message_date) VALUES (?, ?, ?, ?, ?)",
+                [(guild_id, q["content"], q["author"], q["message_id"], q["message_date"]) for q in quotes]
+            )
+        self.ids.pop(guild_id, None)
+
+    def count(self, guild_id):
+        return len(self.guild_ids(guild_id))
+
+    def page(self, guild_id, offset, limit):
+        ids = self.guild_ids(guild_id)
+        if offset < 0 or offset >= len(ids) or limit <= 0:
+            return []
+        rows = self.conn.execute(
+            "SELECT * FROM quotes WHERE guild_id = ? AND id >= ? ORDER BY id LIMIT ?",
+            (guild_id, ids[offset], limit)
+        ).fetchall()
+        return [self.row_to_quote(row) for row in rows]
+
+    def by_author(self, guild_id, author):
+        rows = self.conn.execute(
+            "SELECT * FROM quotes WHERE guild_id = ? AND author = ? ORDER BY id",
+            (guild_id, author)
+        ).fetchall()
+        return [self.row_to_quote(row) for row in rows]
+
+    def remove_at(self, guild_id, index):
+        for attempt in range(2):
+            ids = self.guild_ids(guild_id)
+            if index < 0 or index >= len(ids):
+                return None
+            with self.conn:
+                row = self.conn.execute("SELECT * FROM quotes WHERE id = ?", (ids[index],)).fetchone()
+                if row is not None:
+                    self.conn.execute("DELETE FROM quotes WHERE id = ?", (row["id"],))
+            if row is not None:
+                del ids[index]
+                return self.row_to_quote(row)
+            #Removed behind our back (e.g. by another process), reload the guild's ids and look again.
+            self.ids.pop(guild_id, None)
+        return None
+
+    def close(self):
+        self.conn.close()
+
+def open_quote_store(backend=QUOTE_BACKEND):
+    if backend == "json":
+        return CachedJsonQuoteStore()
+    return SqliteQuoteStore()
+
+#One-shot import of the old server_quotes/<guild_id>.json files. Each imported file is renamed
+#to .json.migrated so running this again (or on every startup) never imports it twice.
+def migrate_json_quotes(store, quote_dir=QUOTE_DIR):
+    migrated = 0
+    if not os.path.isdir(quote_dir):
+        return migrated
+
+    for filename in sorted(os.listdir(quote_dir)):
+        if not filename.endswith(".json"):
+            continue
+        guild_id = filename[:-len(".json")]
+        if not guild_id.isdigit():
+            print(f"Skipping {filename}, it isn't named after a guild id.")
+            continue
+
+        file_path = os.path.join(quote_dir, filename)
+        try:
+            with open(file_path, "r") as f:
+                quotes = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Couldn't migrate {file_path} due to: {e}")
+            continue
+
+        store.add_many(int(guild_id), quotes)
+        os.replace(file_path, file_path + ".migrated")
+        migrated += len(quotes)
+        print(f"Migrated {len(quotes)} quotes for guild {guild_id}")
+
+    return migrated
+
+if __name__ == "__main__":
+    #python -m utils.quotestore [quote_dir]
+    source = sys.argv[1] if len(sys.argv) > 1 else QUOTE_DIR
+    store = SqliteQuoteStore()
+    print(f"Imported {migrate_json_quotes(store, source)} quotes into {QUOTE_DB}")
+    store.close()
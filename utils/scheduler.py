@@ -0,0 +1,125 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger('scheduler')
+
+class ScheduledCall:
+    __slots__ = ("due", "callback", "args", "cancelled")
+
+    def __init__(self, due, callback, args):
+        self.due = due  # unix timestamp
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def remaining(self):
+        return max(0.0, self.due - time.time())
+
+#One driver task for any number of deadlines. Calls sit in a heap ordered by due time,
+#the driver sleeps until the earliest one and fires everything that is due in one batch.
+class DeadlineScheduler:
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self.heap = []
+        self.counter = itertools.count()
+        self.pending = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.running = set()
+
+    def __len__(self):
+        return self.pending
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for task in list(self.running):
+            task.cancel()
+
+    def call_at(self, due, callback, *args):
+        call = ScheduledCall(due, callback, args)
+        heapq.heappush(self.heap, (due, next(self.counter), call))
+        self.pending += 1
+        #Only an earlier deadline changes how long the driver should sleep.
+        if self.heap[0][2] is call:
+            self.wakeup.set()
+        return call
+
+    #Bulk version of call_at for restoring many deadlines at once: one heapify instead of n pushes.
+    def call_many(self, entries):
+        calls = []
+        for due, callback, *args in entries:
+            call = ScheduledCall(due, callback, tuple(args))
+            self.heap.append((due, next(self.counter), call))
+            calls.append(call)
+        heapq.heapify(self.heap)
+        self.pending += len(calls)
+        self.wakeup.set()
+        return calls
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(time.time() + delay, callback, *args)
+
+    #Cancelled calls stay in the heap and are skipped when they reach the top.
+    def cancel(self, call):
+        if not call.cancelled:
+            call.cancelled = True
+            self.pending -= 1
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            batch = []
+            while self.heap and self.heap[0][0] <= now:
+                call = heapq.heappop(self.heap)[2]
+                if not call.cancelled:
+                    call.cancelled = True
+                    self.pending -= 1
+                    batch.append(call)
+
+            for call in batch:
+                self.fire(call)
+
+    def fire(self, call):
+        try:
+            result = call.callback(*call.args)
+        except Exception as e:
+            logger.error(f"[{self.name}] Scheduled callback failed: {e!r}")
+            return
+
+        if asyncio.iscoroutine(result):
+            task = asyncio.create_task(self.guard(result))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def guard(self, coro):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[{self.name}] Scheduled callback failed: {e!r}")
@@ -0,0 +1,52 @@
+import os
+import sqlite3
+
+TIMER_DB = os.getenv("DA_TIMER_DB", "timers.db")
+
+#Pending timers on disk so they outlive a restart. Only ids and a due timestamp are kept,
+#the reminder is sent to the channel rather than through the (short lived) interaction.
+class TimerStore:
+    def __init__(self, path=TIMER_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS timers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    guild_id INTEGER,
+                    channel_id INTEGER NOT NULL,
+                    due REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_timers_user ON timers (user_id);
+            """)
+
+    def add(self, user_id, guild_id, channel_id, due):
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO timers (user_id, guild_id, channel_id, due) VALUES (?, ?, ?, ?)",
+                (user_id, guild_id, channel_id, due)
+            )
+        return cursor.lastrowid
+
+    def remove(self, timer_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM timers WHERE id = ?", (timer_id,))
+
+    #By id rather than by user: other worker processes share this table and own that user's timers in their guilds.
+    def remove_many(self, timer_ids):
+        with self.conn:
+            self.conn.executemany("DELETE FROM timers WHERE id = ?", [(timer_id,) for timer_id in timer_ids])
+
+    #Across every worker, so the per-user cap holds no matter which shard a timer was started on.
+    def count_user(self, user_id):
+        return self.conn.execute("SELECT COUNT(*) FROM timers WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    #Single pass over the table: (id, user_id, guild_id, channel_id, due) rows.
+    def load(self):
+        return self.conn.execute("SELECT id, user_id, guild_id, channel_id, due FROM timers").fetchall()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,88 @@
+import random
+from collections import deque
+from itertools import islice
+
+#Compact record for a queued song, playlists can put thousands of these in one guild's queue.
+class Track:
+    __slots__ = ("title", "url", "requester", "duration", "source_url", "codec", "prefetch")
+
+    def __init__(self, title, url, requester, duration=None, source_url=None, codec=None):
+        self.title = title
+        self.url = url
+        self.requester = requester
+        self.duration = duration  # Seconds, when yt-dlp knows it
+        self.source_url = source_url  # Direct stream URL, filled in lazily right before playback
+        self.codec = codec  # Audio codec of source_url, decides between Opus passthrough and PCM
+        self.prefetch = None  # Background task resolving source_url ahead of time
+
+    def set_format(self, audio_format):
+        self.source_url = audio_format['url']
+        self.codec = audio_format.get('acodec')
+
+class TrackQueue:
+    def __init__(self, tracks=()):
+        self.tracks = deque(tracks)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __bool__(self):
+        return bool(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def __getitem__(self, index):
+        return self.tracks[index]
+
+    def push(self, track):
+        self.tracks.append(track)
+
+    def extend(self, tracks):
+        self.tracks.extend(tracks)
+
+    #Bulk insert at any position, rotating the deque so only one end is touched.
+    def insert_many(self, index, tracks):
+        index = max(0, min(index, len(self.tracks)))
+        self.tracks.rotate(-index)
+        self.tracks.extendleft(reversed(list(tracks)))
+        self.tracks.rotate(index)
+
+    def pop_front(self):
+        return self.tracks.popleft()
+
+    def remove_at(self, index):
+        track = self.tracks[index]
+        del self.tracks[index]
+        return track
+
+    def move(self, source, destination):
+        track = self.remove_at(source)
+        self.tracks.insert(destination, track)
+        return track
+
+    def shuffle(self):
+        tracks = list(self.tracks)
+        random.shuffle(tracks)
+        self.tracks = deque(tracks)
+
+    #Drops repeated links, keeping the first occurrence of each. Returns how many were removed.
+    def dedupe(self):
+        seen = set()
+        kept = []
+        for track in self.tracks:
+            if track.url not in seen:
+                seen.add(track.url)
+                kept.append(track)
+        removed = len(self.tracks) - len(kept)
+        self.tracks = deque(kept)
+        return removed
+
+    def peek(self, count):
+        return list(islice(self.tracks, count))
+
+    def slice(self, start, stop):
+        return list(islice(self.tracks, start, stop))
+
+    def clear(self):
+        self.tracks.clear()